@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+
+"""Compares the memory use and throughput of FastAggregator's nested
+and flat result stores on a synthetic timebin in which most keys have
+a single '' subkey (the common featureCounter output shape)."""
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+from gawseed.analysis.aggregator import FastAggregator
+
+def make_rows(keys, indexes, subkeys):
+    rows = []
+    for index in range(0, indexes):
+        for key in range(0, keys):
+            for subkey in range(0, subkeys):
+                rows.append(['60', 'index%d' % (index), 'key%d.example.com' % (key),
+                             '' if subkey == 0 else 'sub%d' % (subkey), '1'])
+    return rows
+
+def run(store, rows):
+    ag = FastAggregator(store = store)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    output = ag.process(rows)
+
+    # pull the first row so the entire bin is held in memory
+    first = next(output)
+    (current, peak) = tracemalloc.get_traced_memory()
+    count = 1 + sum(1 for row in output)
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+
+    return (count, peak, elapsed)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-k", "--keys", default=200000, type=int,
+                        help="The number of keys per index")
+    parser.add_argument("-i", "--indexes", default=2, type=int,
+                        help="The number of indexes")
+    parser.add_argument("-s", "--subkeys", default=1, type=int,
+                        help="The number of subkeys per key")
+    args = parser.parse_args()
+
+    rows = make_rows(args.keys, args.indexes, args.subkeys)
+    sys.stdout.write("%d input rows\n" % (len(rows)))
+    for store in ['nested', 'flat']:
+        (count, peak, elapsed) = run(store, rows)
+        sys.stdout.write("%-8s %8d rows  %8.1f MB peak  %8.0f rows/s\n" %
+                         (store, count, peak / 1024.0 / 1024.0, len(rows) / elapsed))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+
+"""Compares dnsRegistrationFraction's throughput when each domain
+looks up and converts its registration point's count itself, and when
+that denominator is converted once per timebin bundle."""
+
+import argparse
+import sys
+import time
+
+import gawseed.algorithm.dns
+from gawseed.algorithm.dns import PSL_registration_raw
+from gawseed.algorithm.relationship import lookup
+
+def per_row(bundle, key, subkey, thisone, args):
+    "dnsRegistrationFraction without the per-bundle denominator memo."
+    if args[0] in thisone:
+        reg_count = lookup(bundle, key, subkey, thisone,
+                           [PSL_registration_raw(key), '', args[1]])
+        if reg_count:
+            return(float(thisone[args[0]]) / float(reg_count))
+
+def make_bundle(domains, registrations):
+    data = {}
+    for registration in range(0, registrations):
+        data['reg%d.com' % (registration)] = { '': { 'registrations': str(domains * 10.0) } }
+    for domain in range(0, domains):
+        name = 'www.domain%d.reg%d.com' % (domain, domain % registrations)
+        data[name] = { '': { 'domains': str(float(domain % 10 + 1)) } }
+    return { 'time_index': '60', 'data': data }
+
+def run(function, bundle, repeat):
+    args = ['domains', 'registrations']
+    rows = [(key, subkey, slot) for (key, subkeys) in bundle['data'].items()
+            for (subkey, slot) in subkeys.items()]
+
+    start = time.perf_counter()
+    for count in range(0, repeat):
+        bundle['cache'] = {}
+        for (key, subkey, slot) in rows:
+            function(bundle, key, subkey, slot, args)
+    return (len(rows) * repeat, time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-d", "--domains", default=100000, type=int,
+                        help="The number of domains per bin")
+    parser.add_argument("-r", "--registrations", default=20, type=int,
+                        help="The number of registration points")
+    parser.add_argument("-n", "--repeat", default=10, type=int,
+                        help="The number of bins to process")
+    args = parser.parse_args()
+
+    bundle = make_bundle(args.domains, args.registrations)
+    for (name, function) in [('per-row', per_row),
+                             ('per-bin', gawseed.algorithm.dns.dnsRegistrationFraction)]:
+        (count, elapsed) = run(function, bundle, args.repeat)
+        sys.stdout.write("%-8s %8d calls  %8.3f s  %8.0f calls/s\n" %
+                         (name, count, elapsed, count / elapsed))
+
+if __name__ == "__main__":
+    main()
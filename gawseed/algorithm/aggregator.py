@@ -1,4 +1,35 @@
+from gawseed.hyperLogLog import HyperLogLog
+
+# Aggregator functions are called once per row as:
+#
+#   function(index, key, subkey, value, results, args)
+#
+# Aggregators may also be given begin_bin and/or end_bin attributes,
+# which are called as function(time, results, args) when a timebin's
+# results are first created and just before they are emitted.
+#
+# Aggregators that need private per-timebin storage should use
+# _bin_storage(), which keeps it inside the timebin's results under the
+# reserved BIN_STORAGE index.  FastAggregator removes that index before
+# emitting the results, so the storage is released along with them.
+
+BIN_STORAGE = None
+
+def _bin_storage(results, name):
+    """Returns the private storage dictionary called name for a
+       timebin's results."""
+    if BIN_STORAGE not in results:
+        results[BIN_STORAGE] = {}
+    storage = results[BIN_STORAGE]
+    if name not in storage:
+        storage[name] = {}
+    return storage[name]
+
 def summer(index, key, subkey, value, results, args = []):
+    # serialized sketches (see hll_unique) can't be summed
+    if HyperLogLog.is_serialized(value):
+        return
+
     # index
     if index not in results:
         results[index] = {}
@@ -74,37 +105,68 @@ def unique(index, key, subkey, value, results, args = []):
     matching_index = args[0]
     unique_index_string = args[1]
 
-    if len(args) < 3:
-        args.append({})
-
-    storage = args[2]
-
     # only match a particular index value
     if matching_index != index:
         return
 
+    # the subkeys seen are stored separately for each timebin's results
+    storage = _bin_storage(results, ('unique', unique_index_string))
+
     # index
-    if unique_index_string not in storage:
-        storage[unique_index_string] = {}
     if unique_index_string not in results:
         results[unique_index_string] = {}
-            
         
     # key
-    if key not in storage[unique_index_string]:
-        storage[unique_index_string][key] = { }
+    if key not in storage:
+        storage[key] = set()
     if key not in results[unique_index_string]:
         results[unique_index_string][key] = { unique_index_string: 0 }
 
     # subkey
-    if subkey not in storage[unique_index_string][key]:
-        # XXX: really the summer should be listed before this
-        # so that we don't have to force check something different
-        # or we need temporary storage
-        # XXX: could in theory store a temp hash in args[2]?
-        storage[unique_index_string][key][subkey] = 1
+    if subkey not in storage[key]:
+        storage[key].add(subkey)
         results[unique_index_string][key][unique_index_string] += 1
-    
+
+# hll_unique:
+#   Estimates the number of unique subkey's within each key in a given
+#   index using a fixed size HyperLogLog per key, rather than
+#   remembering every subkey seen.  Rows whose value is a serialized
+#   HyperLogLog (eg, from a featureCounter output using
+#   gawseed.algorithm.generic.combine_hll) are merged in instead,
+#   allowing distributed counts to be combined.
+#
+# arguments:
+#   0: index string to match against
+#   1: index string to store results in
+#   2: the HyperLogLog precision (optional; default 12)
+def hll_unique(index, key, subkey, value, results, args = []):
+    matching_index = args[0]
+    unique_index_string = args[1]
+
+    precision = args[2] if len(args) > 2 else 12
+
+    # only match a particular index value
+    if matching_index != index:
+        return
+
+    # the registers are stored separately for each timebin's results
+    storage = _bin_storage(results, ('hll_unique', unique_index_string))
+
+    if key not in storage:
+        storage[key] = HyperLogLog(precision)
+    sketch = storage[key]
+
+    if isinstance(value, HyperLogLog):
+        sketch.merge(value)
+    elif HyperLogLog.is_serialized(value):
+        sketch.merge(HyperLogLog.deserialize(value))
+    else:
+        sketch.add(subkey)
+
+    if unique_index_string not in results:
+        results[unique_index_string] = {}
+    results[unique_index_string][key] = { unique_index_string: int(round(sketch.cardinality())) }
+
 def value_max(index, key, subkey, value, results, args = []):
     unique_index = None
     if len(args) > 0:
@@ -127,3 +189,118 @@ def value_max(index, key, subkey, value, results, args = []):
     else: 
         results[unique_index][key][subkey] = max(value, results[unique_index][key][subkey])
     
+
+#
+# Flat result store variants
+#
+# When FastAggregator is configured with a 'flat' store, results is a
+# single dictionary keyed by (index, key, subkey) tuples rather than
+# nested index/key/subkey dictionaries, and each aggregator's 'flat'
+# attribute is called instead.
+#
+
+def summer_flat(index, key, subkey, value, results, args = []):
+    # serialized sketches (see hll_unique) can't be summed
+    if HyperLogLog.is_serialized(value):
+        return
+
+    entry = (index, key, subkey)
+    if entry in results:
+        results[entry] += value
+    else:
+        results[entry] = value
+
+summer.flat = summer_flat
+
+def sumAndCountUnique_flat(index, key, subkey, value, results, args = []):
+    if len(args) > 0:
+        unique_index = args[0]
+    else:
+        unique_index = index + "_unique"
+
+    entry = (index, key, subkey)
+    if entry in results:
+        results[entry] += value
+    else:
+        results[entry] = value
+        unique_entry = (unique_index, key, 'unique')
+        results[unique_entry] = results.get(unique_entry, 0) + 1
+
+sumAndCountUnique.flat = sumAndCountUnique_flat
+
+def stringSplitter_flat(index, key, subkey, value, results, args = []):
+    if len(args) > 0:
+        split_index = args[0]
+    else:
+        split_index = index + "_split"
+
+    for newkey in key.split():
+        entry = (split_index, newkey, '')
+        if entry in results:
+            results[entry] += 1
+        else:
+            results[entry] = 1.0
+
+stringSplitter.flat = stringSplitter_flat
+
+def unique_flat(index, key, subkey, value, results, args = []):
+    matching_index = args[0]
+    unique_index_string = args[1]
+
+    # only match a particular index value
+    if matching_index != index:
+        return
+
+    storage = _bin_storage(results, ('unique', unique_index_string))
+    if key not in storage:
+        storage[key] = set()
+
+    entry = (unique_index_string, key, unique_index_string)
+    if entry not in results:
+        results[entry] = 0
+
+    if subkey not in storage[key]:
+        storage[key].add(subkey)
+        results[entry] += 1
+
+unique.flat = unique_flat
+
+def hll_unique_flat(index, key, subkey, value, results, args = []):
+    matching_index = args[0]
+    unique_index_string = args[1]
+
+    precision = args[2] if len(args) > 2 else 12
+
+    # only match a particular index value
+    if matching_index != index:
+        return
+
+    storage = _bin_storage(results, ('hll_unique', unique_index_string))
+    if key not in storage:
+        storage[key] = HyperLogLog(precision)
+    sketch = storage[key]
+
+    if isinstance(value, HyperLogLog):
+        sketch.merge(value)
+    elif HyperLogLog.is_serialized(value):
+        sketch.merge(HyperLogLog.deserialize(value))
+    else:
+        sketch.add(subkey)
+
+    results[(unique_index_string, key, unique_index_string)] = int(round(sketch.cardinality()))
+
+hll_unique.flat = hll_unique_flat
+
+def value_max_flat(index, key, subkey, value, results, args = []):
+    if len(args) > 0:
+        max_index = args[0]
+    else:
+        max_index = index + "_max"
+
+    entry = (max_index, key, subkey)
+    if entry in results:
+        results[entry] = max(value, results[entry])
+    else:
+        results[entry] = value
+
+value_max.flat = value_max_flat
@@ -1,3 +1,5 @@
+import functools
+
 DNSSplitter = None
 
 # The publicSuffixList module is used a lot in the following code
@@ -6,7 +8,7 @@ DNSSplitter = None
 
 try:
     from dnssplitter import DNSSplitter
-    from gawseed.algorithm.relationship import lookup, lookup_maybe_ra
+    from gawseed.algorithm.relationship import lookup, lookup_maybe_ra, bundle_cache
 except:
     import zipimport
     z = zipimport.zipimporter("gawseed-modules.mod")
@@ -15,26 +17,60 @@ except:
 
 psl = DNSSplitter()
 
+# DNS names repeat heavily within traffic, and a single row is often
+# split by several PSL_* outputs, so the split results are memoized.
+PSL_CACHE_SIZE = 100000
+
+_last_name = None
+_last_split = None
+
+def _search_tree(name):
+    result = psl.search_tree(name)
+    if result:
+        return tuple(result)
+    return result
+
+_cached_search_tree = functools.lru_cache(maxsize=PSL_CACHE_SIZE)(_search_tree)
+
+def set_psl_cache_size(size):
+    """Resizes (and clears) the cache of PSL split results.
+       A size of 0 disables caching."""
+    global _cached_search_tree, _last_name, _last_split
+    _cached_search_tree = functools.lru_cache(maxsize=size)(_search_tree)
+    _last_name = None
+    _last_split = None
+
+def search_tree(name):
+    """Returns the (cached) [prefix, domain, public_point] split of a name.
+       The most recent name is remembered separately so multiple
+       outputs reading the same column of a row only split it once."""
+    global _last_name, _last_split
+    if name == _last_name:
+        return _last_split
+    _last_split = _cached_search_tree(name)
+    _last_name = name
+    return _last_split
+
 #
 # public suffix list based featureCounter routines
 #
 def PSL_registration(row, cols):
     """Returns the registration point for a domain (.com for www.example.com)"""
-    psl_data = psl.search_tree(row[cols[0]])
+    psl_data = search_tree(row[cols[0]])
     if psl_data:
         return(psl_data[2], '')
     return (None, None)
 
 def PSL_domain(row, cols):
     """Returns the domain point for a domain (example.com for www.example.com)"""
-    psl_data = psl.search_tree(row[cols[0]])
+    psl_data = search_tree(row[cols[0]])
     if psl_data:
         return(psl_data[1], '')
     return (None, None)
 
 def PSL_prefix(row, cols):
     """Returns the prefix a domain (www.images for www.images.example.com)"""
-    psl_data = psl.search_tree(row[cols[0]])
+    psl_data = search_tree(row[cols[0]])
     if psl_data:
         return(psl_data[1], psl_data[0])
     return (None, None)
@@ -43,7 +79,7 @@ def PSL_prefix(row, cols):
 def PSL_reg_and_dom(row, cols):
     """Returns key=registration point, and subkey=domain name
        Example: returns ["com","example.com"] for www.example.com)"""
-    psl_data = psl.search_tree(row[cols[0]])
+    psl_data = search_tree(row[cols[0]])
     if psl_data:
         return(psl_data[2], psl_data[1])
     return (None, None)
@@ -52,7 +88,7 @@ def PSL_reg_and_dom(row, cols):
 def PSL_dom_and_pre(row, cols):
     """Returns key=domain, and subkey=prefix
        Example: returns ["exmaple.com","www"] for www.example.com)"""
-    psl_data = psl.search_tree(row[cols[0]])
+    psl_data = search_tree(row[cols[0]])
     if psl_data:
         return(psl_data[1], psl_data[0])
     return (None, None)
@@ -61,7 +97,7 @@ def PSL_dom_and_pre(row, cols):
 def PSL_dom_and_srcip(row, cols):
     """Returns key=domain, and subkey=srcip
        Example: returns ["exmaple.com","1.2.3.4"] for www.example.com from 1.2.3.4"""
-    psl_data = psl.search_tree(row[cols[0]])
+    psl_data = search_tree(row[cols[0]])
     if psl_data:
         return(psl_data[1], row[cols[1]])
     return (None, None)
@@ -70,13 +106,13 @@ def PSL_dom_and_srcip(row, cols):
 def PSL_reg_and_srcip(row, cols):
     """Returns key=registration point, and subkey=srcip
        Example: returns ["com","1.2.3.4"] for www.example.com from 1.2.3.4"""
-    psl_data = psl.search_tree(row[cols[0]])
+    psl_data = search_tree(row[cols[0]])
     if psl_data:
         return(psl_data[2], row[cols[1]])
     return (None, None)
 
 def PSL_registration_raw(name):
-    psl_data = psl.search_tree(name)
+    psl_data = search_tree(name)
     if psl_data:
         return psl_data[2]
 
@@ -94,6 +130,22 @@ def dns_label_count(rows, args):
 # relationshipAnalysis functions
 #
 
+def registration_denominator(bundle, registration, index):
+    """Returns the float count of a registration point for index (or
+       None when it's missing).  Every domain under the same
+       registration point divides by it, so it's converted once per
+       bundle."""
+    denominators = bundle_cache(bundle, 'registration:' + index)
+    if registration in denominators:
+        return denominators[registration]
+
+    denominator = None
+    reg_count = lookup(bundle, None, None, None, [registration, '', index])
+    if reg_count:
+        denominator = float(reg_count)
+    denominators[registration] = denominator
+    return denominator
+
 def dnsRegistrationFraction(bundle, key, subkey, thisone, args):
     # looks up the prefix of the key=domain given in a row with index=arg[0]
     # the row found will be in index=arg[1]
@@ -101,10 +153,9 @@ def dnsRegistrationFraction(bundle, key, subkey, thisone, args):
     # returning the fraction of the domain within its registration point
     # eg: count(example.com) / count(com)
     if args[0] in thisone: # only process ones that are domains
-        reg_count = lookup(bundle, key, subkey, thisone,
-                           [PSL_registration_raw(key), '', args[1]])
-        if reg_count:
-            return(float(thisone[args[0]]) / float(reg_count))
+        reg_count = registration_denominator(bundle, PSL_registration_raw(key), args[1])
+        if reg_count is not None:
+            return(float(thisone[args[0]]) / reg_count)
 
 def dnsPrefixFraction(bundle, key, subkey, thisone, args):
     """Check the fraction of prefixes vs the base domain.
@@ -127,7 +178,7 @@ def dnsDDoSMetric(bundle, key, subkey, thisone, args):
     # PP(cnt(PSL_D(D)) | cnt(PSL_S(D))) * SW(unique(PSL_P(D)) | cnt(PSL_D(D)))
     # = (count(PSL_D(D)) * unique(PSL_P(D))) / (count(PSL_S(D)) * count(PSL_D(D)))
     # = unique(PSL_P(D)) / count(PSL_S(D))
-    psl_results = psl.search_tree(key)
+    psl_results = search_tree(key)
     if not psl_results or psl_results[1] == '' or subkey != '':
         return None
     (prefix, domain, suffix) = psl_results
@@ -163,6 +163,31 @@ def combine_summer(timebin, index, key, subkey, val1, val2):
         return val1 + val2
     return val2
 
+def combine_hll(timebin, index, key, subkey, val1, val2):
+    """Collects the values into a HyperLogLog for estimating the number
+       of unique values seen, which will be output in a serialized
+       form that the gawseed.algorithm.aggregator.hll_unique
+       aggregator can merge.
+
+       YAML usage (counts the unique names seen per domain):
+
+       outputs:
+         outcol:
+           function:         PSL_domain
+           arguments:        [col(NAMECOL)]
+           value:            column_value
+           value_arguments:  [col(NAMECOL)]
+           combine:          combine_hll
+    """
+    from gawseed.hyperLogLog import HyperLogLog
+    if val1 is None:
+        val1 = HyperLogLog()
+    if isinstance(val2, HyperLogLog):
+        val1.merge(val2)
+    else:
+        val1.add(val2)
+    return val1
+
 def combine_value_max(timebin, index, key, subkey, val1, val2):
     if _max_data[key]:
         return _max_data[key]
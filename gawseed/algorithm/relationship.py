@@ -1,9 +1,41 @@
 import sys
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # bundle: is all data at that timeslot (inside 'data' dict-entry)
 # key, subkey
 # current_slot is bundle[key][subkey] extracted already
 # args = user passed arguments
+#
+# Functions may also have a 'vectorized' attribute, which is used by a
+# vectorized RelationshipAnalysis to calculate a column for an entire
+# timebin at once.  It is called as function(pivot, args) with a
+# gawseed.analysis.relationshipAnalysis.BinPivot and returns a list
+# of values (or None) for each of the pivot's cells.
+#
+# Functions that remember data from earlier timebins should set a true
+# 'stateful' attribute, since they can't be split across workers.
+
+def bundle_cache(bundle, name):
+    """Returns a memo dictionary called name that is shared by all the
+       functions processing a bundle, and is discarded along with the
+       bundle once its timebin has been processed."""
+    if 'cache' not in bundle:
+        bundle['cache'] = {}
+    cache = bundle['cache']
+    if name not in cache:
+        cache[name] = {}
+    return cache[name]
+
+def _results(values, valid):
+    "Converts an array of results into a list, with None where not valid."
+    results = values.tolist()
+    for row in numpy.flatnonzero(~valid):
+        results[row] = None
+    return results
 
 def debug(bundle, key, subkey, current_slot, args):
     print("#+ " + str(current_slot))
@@ -13,13 +45,33 @@ def fraction(bundle, key, subkey, current_slot, args):
     if args[0] in current_slot and args[1] in current_slot:
         return float(current_slot[args[0]]) / float(current_slot[args[1]])
 
+def fraction_vectorized(pivot, args):
+    valid = pivot.present(args[0]) & pivot.present(args[1])
+    denominators = pivot.values(args[1])
+    if numpy.any(denominators[valid] == 0):
+        raise ZeroDivisionError("float division by zero")
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return _results(pivot.values(args[0]) / denominators, valid)
+
+fraction.vectorized = fraction_vectorized
+
 def one(bundle, key, subkey, current_slot, args):
     return 1.0
 
+def one_vectorized(pivot, args):
+    return [1.0] * len(pivot)
+
+one.vectorized = one_vectorized
+
 def value(bundle, key, subkey, current_slot, args):
     if args[0] in current_slot:
         return current_slot[args[0]]
 
+def value_vectorized(pivot, args):
+    return pivot.raw(args[0]).tolist()
+
+value.vectorized = value_vectorized
+
 def lookup(bundle, key, subkey, current_slot, args):
     # key, subkey and current_slot are ignored; instead args specifies it:
     # args = [key-to-lookup, subkey-to-lookup, index]
@@ -73,6 +125,15 @@ def fraction_otherindex_keyval(bundle, key, subkey, current_slot, args):
         if denominator and denominator != "0.0":
             return(float(current_slot[numerator_index]) / float(denominator))
 
+def fraction_otherindex_keyval_vectorized(pivot, args):
+    # zero (or missing) denominators produce no value
+    denominators = pivot.lookup_values(args[1])
+    valid = pivot.present(args[0]) & (denominators != 0) & ~numpy.isnan(denominators)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return _results(pivot.values(args[0]) / denominators, valid)
+
+fraction_otherindex_keyval.vectorized = fraction_otherindex_keyval_vectorized
+
 _max_data = {}
 def value_max(bundle, key, subkey, current_slot, args):
     col = args[0]
@@ -91,4 +152,7 @@ def value_max(bundle, key, subkey, current_slot, args):
 
     _max_data[key][subkey] = max(_max_data[key][subkey], current_slot[col])
     return _max_data[key][subkey]
+
+# value_max remembers values from earlier timebins
+value_max.stateful = True
     
@@ -1,9 +1,34 @@
 #!/usr/bin/python3
 
+import heapq
+import math
+import sys
+
 import gawseed.analysis
 import pdb
 from gawseed.support.functionLoader import load_function
-from gawseed.algorithm.aggregator import summer
+from gawseed.algorithm.aggregator import summer, BIN_STORAGE
+from gawseed.hyperLogLog import HyperLogLog
+from gawseed.support.externalSort import external_sort, merge_runs, write_run
+
+def _time_checked(rows, time_column, name):
+    "Passes through rows, ensuring their times never go backwards."
+    last_time = None
+    for row in rows:
+        row_time = float(row[time_column])
+        if last_time is not None and row_time < last_time:
+            raise ValueError("Time went backwards in %s -- each merged input must be pre-sorted for time" % (name))
+        last_time = row_time
+        yield row
+
+def merge_sorted_inputs(inputs, time_column=0):
+    """Merges multiple row iterators (eg, featureCounter outputs from
+       different hosts), each already sorted by time, into a single
+       time-sorted stream suitable for FastAggregator.process().  Only
+       one row from each input is held in memory at a time."""
+    checked = [_time_checked(rows, time_column, "input %d" % (number))
+               for (number, rows) in enumerate(inputs)]
+    return heapq.merge(*checked, key=lambda row: float(row[time_column]))
 
 class FastAggregator(gawseed.analysis.Analysis):
     """Aggregates information together from multiple FeatureCounter outputs.
@@ -15,12 +40,33 @@ class FastAggregator(gawseed.analysis.Analysis):
        FastAggregator assumes keys are always sorted(time), index,
        key, subkey, value.  See the Aggregator class for a class that
        doesn't require this structure.
+
+       By default results are collected in nested
+       results[index][key][subkey] dictionaries.  A store of 'flat'
+       (or a 'store: flat' aggregator YAML setting) instead collects
+       them in a single dictionary keyed by (index, key, subkey)
+       tuples of interned strings, which uses much less memory when
+       most keys have a single subkey.  This requires every
+       aggregator function to have a 'flat' variant, and rows are
+       emitted in the order they were first created rather than
+       grouped by index and key.
+
+       Input is normally required to be sorted by time.  Setting
+       max_lateness (or a 'maxLateness' aggregator YAML setting) to
+       N instead keeps the N timebins before the newest one open, so
+       slightly out of order rows are still aggregated into them.
+       Timebins are emitted in time order once more than N newer
+       timebins have been seen, and rows for already emitted
+       timebins are dropped and counted in late_rows.
     """
     _results = {}
     _last_time = 0
     _aggregators = [ summer ]
+    _store = 'nested'
+    _max_lateness = None
+    _late_rows = 0
 
-    def __init__(self, aggregators = [summer], import_from_zip = None, yaml_specification = None):
+    def __init__(self, aggregators = [summer], import_from_zip = None, yaml_specification = None, store = None, max_lateness = None):
         self._aggregators = []
         self._import_from_zip = import_from_zip
         super().__init__(None, None, yaml_specification)
@@ -31,6 +77,20 @@ class FastAggregator(gawseed.analysis.Analysis):
             if 'aggregators' not in self._specification['aggregator']:
                 raise ValueError('aggregator specification requires an aggregators token of an array of functions')
             aggregators = self._specification['aggregator']['aggregators']
+            if store is None:
+                store = self._specification['aggregator'].get('store')
+            if max_lateness is None:
+                max_lateness = self._specification['aggregator'].get('maxLateness')
+
+        if max_lateness is not None:
+            max_lateness = int(max_lateness)
+            if max_lateness < 0:
+                raise ValueError("maxLateness must not be negative")
+        self._max_lateness = max_lateness
+
+        self._store = store or 'nested'
+        if self._store not in ['nested', 'flat']:
+            raise ValueError("unknown aggregator store '%s' (should be nested or flat)" % (self._store))
 
         for definition in aggregators:
             # load the function if it's a string specification
@@ -49,8 +109,7 @@ class FastAggregator(gawseed.analysis.Analysis):
                 fn = load_function(function, default_module = 'gawseed.algorithm.aggregator',
                                    import_from_zip=self._import_from_zip)
 
-                self._aggregators.append({ 'function' : fn,
-                                           'arguments': args})
+                self._aggregators.append(self._definition(fn, args))
 
             # loaded from yaml
             elif type(definition) == type({}): 
@@ -60,46 +119,174 @@ class FastAggregator(gawseed.analysis.Analysis):
 
                 fn = load_function(definition['function'],
                                    default_module = 'gawseed.algorithm.aggregator')
-                self._aggregators.append({ 'function': fn,
-                                           'arguments' : arguments})
+                self._aggregators.append(self._definition(fn, arguments))
 
             # assume its otherwise a python function object
             else:
-                self._aggregators.append({ 'function': definition,
-                                           'arguments' : []})
+                self._aggregators.append(self._definition(definition, []))
+
+    def _definition(self, function, arguments):
+        if self._store == 'flat':
+            if not hasattr(function, 'flat'):
+                raise ValueError("aggregator function '%s' does not support the flat store" % (function.__name__))
+            function = function.flat
+
+        return { 'function': function,
+                 'arguments': arguments,
+                 'begin_bin': getattr(function, 'begin_bin', None),
+                 'end_bin': getattr(function, 'end_bin', None) }
+
+    def begin_bin(self, time, results):
+        "Calls the begin_bin hooks of any aggregators that have one."
+        for aggregator in self._aggregators:
+            if aggregator['begin_bin']:
+                aggregator['begin_bin'](time, results, aggregator['arguments'])
+
+    def end_bin(self, time, results):
+        "Calls the end_bin hooks of any aggregators that have one."
+        for aggregator in self._aggregators:
+            if aggregator['end_bin']:
+                aggregator['end_bin'](time, results, aggregator['arguments'])
+
+    def emit(self, time, results):
+        "Generates the output rows for a timebin's results."
+        if self._store == 'flat':
+            for ((index, key, subkey), value) in results.items():
+                yield [time, index, key, subkey, value]
+            return
+
+        for index in results:
+            for key in results[index]:
+                for subkey in results[index][key]:
+                    yield [time, index, key, subkey, results[index][key][subkey]]
+
+    @property
+    def late_rows(self):
+        "The number of rows dropped for arriving after their timebin was emitted."
+        return self._late_rows
+
+    def _finish(self, time, results):
+        "Runs the end_bin hooks for a timebin and generates its rows."
+        self.end_bin(time, results)
+        # drop the aggregators' private storage (see _bin_storage)
+        results.pop(BIN_STORAGE, None)
+        yield from self.emit(time, results)
 
     def process(self, data_iterator):
         self._last_time = -1
+        self._late_rows = 0
+        flat = self._store == 'flat'
+        intern = sys.intern
+        is_serialized = HyperLogLog.is_serialized
+        max_lateness = self._max_lateness
+
+        # timebins still accepting rows: numeric time -> (time, results)
+        open_bins = {}
+        newest = None     # the newest numeric time seen
+        finished = None   # the newest numeric time already emitted
+        results = None
+
         for row in data_iterator:
             if row[0] != self._last_time:
-                if int(self._last_time) > int(row[0]):
-                    raise ValueError("Time went backwards -- input data must be pre-sorted for time")
-
-                # end of a timestream, so start releasing the current collected data
-                for index in self._results:
-                    for key in self._results[index]:
-                        for subkey in self._results[index][key]:
-                            yield [self._last_time, index, key, subkey, self._results[index][key][subkey]]
-
-                self._results = {}
+                numeric_time = int(row[0])
+
+                if numeric_time in open_bins:
+                    results = open_bins[numeric_time][1]
+                elif max_lateness is None:
+                    if newest is not None and newest > numeric_time:
+                        raise ValueError("Time went backwards -- input data must be pre-sorted for time")
+
+                    for (time, old_results) in open_bins.values():
+                        yield from self._finish(time, old_results)
+                    open_bins = {}
+
+                    results = {}
+                    open_bins[numeric_time] = (row[0], results)
+                    self.begin_bin(row[0], results)
+                elif ((finished is not None and numeric_time <= finished) or
+                      (len(open_bins) > max_lateness and numeric_time < min(open_bins))):
+                    # its timebin was already emitted or is outside the window
+                    self._late_rows += 1
+                    continue
+                else:
+                    # release the oldest bins to make room in the window
+                    while len(open_bins) > max_lateness:
+                        finished = min(open_bins)
+                        (time, old_results) = open_bins.pop(finished)
+                        yield from self._finish(time, old_results)
+
+                    results = {}
+                    open_bins[numeric_time] = (row[0], results)
+                    self.begin_bin(row[0], results)
+
+                if newest is None or numeric_time > newest:
+                    newest = numeric_time
                 self._last_time = row[0]
+                self._results = results
 
             index = row[1]
             key = row[2]
             subkey = row[3]
-            value = float(row[4]) # always?
+            value = row[4]
+            if flat:
+                # share the strings between all the result tuples
+                index = intern(index)
+                key = intern(key)
+                subkey = intern(subkey)
+
+            # serialized sketches are left for an aggregator to merge
+            if not is_serialized(value):
+                value = float(value)
     
             for aggregator in self._aggregators:
-                aggregator['function'](index, key, subkey, value, self._results, aggregator['arguments'])
+                aggregator['function'](index, key, subkey, value, results, aggregator['arguments'])
                                    
-        # release the final data
-        for index in self._results:
-            for key in self._results[index]:
-                for subkey in self._results[index][key]:
-                    yield [self._last_time, index, key, subkey, self._results[index][key][subkey]]
+        # release the remaining data
+        for numeric_time in sorted(open_bins):
+            (time, old_results) = open_bins[numeric_time]
+            yield from self._finish(time, old_results)
+        self._results = {}
+
+def _sort_value(value):
+    """Returns a sort key for a column value that orders numbers
+       numerically (before any non-numeric strings).  Values that
+       are numerically equal but written differently (1 and 1.0)
+       still sort apart, so equal values always end up adjacent.
+       Non-finite values (nan, inf) sort as strings, since a nan
+       compares unequal to everything and would break the ordering."""
+    try:
+        number = float(value)
+        if math.isfinite(number):
+            return (0, number, str(value))
+    except (TypeError, ValueError):
+        pass
+    return (1, 0.0, str(value))
 
 class Aggregator(gawseed.analysis.Analysis):
-    """Currently broken -- do not use"""
+    """Aggregates the rows of an arbitrary table, summing the
+       value_columns for every unique combination of the
+       non_sorted_fields within each unique combination of the
+       sorted_fields.
+
+       The input is assumed to already be sorted by the
+       sorted_fields, so that only one group of sorted field values
+       is collected at a time.  The non_sorted_fields of a group are
+       summed in a hash table, and whenever that table grows past
+       max_memory_rows entries it is spilled to a sorted temporary
+       file in temp_directory.  The spilled tables are merged back
+       together once the group ends.
+
+       When sorted_input is False, the input is instead first sorted
+       by both the sorted_fields and the non_sorted_fields (again
+       spilling at most max_memory_rows rows at a time), which puts
+       equal keys next to each other so they can be summed without
+       any table at all.
+
+       Output rows contain the sorted fields, then the non-sorted
+       fields and then the summed value columns.  Within each group
+       of sorted field values, rows are emitted sorted by their
+       non-sorted fields.
+    """
     _sorted = []
     _sorted_len = 0
     _non_sorted = []
@@ -109,33 +296,32 @@ class Aggregator(gawseed.analysis.Analysis):
 
     _primary_indexes = []
 
-    _current_depth = 0
     _results = {}
 
-    def __init__(self, aggregator = summer,
+    def __init__(self,
                  sorted_fields = [0],
                  non_sorted_fields = [1, 2, 3],
-                 value_columns = [4]):
+                 value_columns = [4],
+                 sorted_input = True,
+                 max_memory_rows = 1000000,
+                 temp_directory = None):
+        super().__init__()
 
-        self._sorted = sorted_fields
-        self._sorted_len = len(sorted_fields)
+        self.sorted_fields = sorted_fields
+        self.non_sorted_fields = non_sorted_fields
+        self.value_columns = value_columns
 
-        self._non_sorted = non_sorted_fields
-        self._non_sorted_len = len(non_sorted_fields)
-
-        self._value_columns = value_columns
-        self._value_columns_len = len(value_columns)
-
-        self._primary_indexes = []
-        for i in range(0, self._sorted_len):
-            self._primary_indexes.append(None)
+        self._sorted_input = sorted_input
+        self._max_memory_rows = max_memory_rows
+        self._temp_directory = temp_directory
+        self._results = {}
 
     @property
     def sorted_fields(self):
         return self._sorted
 
     @sorted_fields.setter
-    def set_sorted_fields(self, newlist):
+    def sorted_fields(self, newlist):
         self._sorted_len = len(newlist)
         self._sorted = newlist
         
@@ -148,8 +334,8 @@ class Aggregator(gawseed.analysis.Analysis):
         return self._non_sorted
 
     @non_sorted_fields.setter
-    def set_non_sorted_fields(self, newlist):
-        self._not_sorted_len = len(newlist)
+    def non_sorted_fields(self, newlist):
+        self._non_sorted_len = len(newlist)
         self._non_sorted = newlist
 
     @property
@@ -157,55 +343,46 @@ class Aggregator(gawseed.analysis.Analysis):
         return self._value_columns
 
     @value_columns.setter
-    def set_value_columns(self, newlist):
-        self._len_value_columns = len(newlist)
+    def value_columns(self, newlist):
+        self._value_columns_len = len(newlist)
         self._value_columns = newlist
 
-    def transform_results_recursive(self, results, keys = [], depth = 0):
-        if depth == self._non_sorted_len - 1:
-            # we're down to the bottom, report results
-            #pdb.set_trace()
-            for item in results:
-                rowkeys=keys[:]
-                rowkeys.append(item)
-                for value in results[item]:
-                    rowkeys.append(value)
-                yield rowkeys
-        else:
-            for item in results:
-                subkeys = keys[:]
-                subkeys.append(item)
-                yield from self.transform_results_recursive(results[item], subkeys, depth+1)            
-
-    def transform_results_broken(self, results):
-        if not results:
-            results = self._results
-
-        # our primary keys become the first columns,
-        # with the secondary keys in depth
-        current_indexes = []
-        for i in range(0, self._sorted_len):
-            current_indexes.append(self._primary_indexes[i])
-
-        # a stack of keys we'll build as we descend into the tree
-        ckeys = []
-
-        # a reference to the current point in the tree
-        tree_ref = results
-        tree_refs = [results]
-
-        for i in range(0, self._non_sorted_len + 1):
-            tree_refs.append(tree_ref)
-            for key in tree_ref:
-                pass
-
-        result_rows = []
-        resultref = self._results 
-        for i in range(0, self._non_sorted_len):
-            if row[i] not in resultref:
-                resultref[row[i]] = {}
-
-            current_row = current_indexes[:] # this is faster than .copy()
+    def sort_key(self, row):
+        "Returns the key used to sort unsorted input rows."
+        return tuple([_sort_value(row[column])
+                      for column in self._sorted + self._non_sorted])
+
+    def record_key(self, record):
+        "Returns the key used to sort (keys, values) records."
+        return tuple([_sort_value(value) for value in record[0]])
+
+    def sum_adjacent(self, records):
+        """Sums the values of adjacent (keys, values) records with
+           equal keys, generating output rows."""
+        last_keys = None
+        last_values = None
+        for (keys, values) in records:
+            if keys == last_keys:
+                for i in range(0, self._value_columns_len):
+                    last_values[i] += values[i]
+                continue
+
+            if last_keys is not None:
+                yield list(last_keys) + last_values
+            last_keys = keys
+            last_values = list(values)
+
+        if last_keys is not None:
+            yield list(last_keys) + last_values
+
+    def transform_results(self, results, runs):
+        """Generates the output rows for a group's results table,
+           merged with any tables that were spilled to runs."""
+        table = sorted(results.items(), key=self.record_key)
+        if not runs:
+            yield from self.sum_adjacent(table)
+            return
+        yield from self.sum_adjacent(merge_runs(runs + [table], self.record_key))
 
     # for each incoming row we:
     #    - test to see if the sorted indexes are still the same; if
@@ -213,40 +390,50 @@ class Aggregator(gawseed.analysis.Analysis):
     #    - set the saved indexes to the existing ones, and continue
     #      collecting the sub-data in the other indexes.
     def process(self, data_iterator):
+        key_fields = self._sorted + self._non_sorted
+        value_columns = self._value_columns
+
+        if not self._sorted_input:
+            rows = external_sort(data_iterator, key=self.sort_key,
+                                 max_records=self._max_memory_rows,
+                                 directory=self._temp_directory)
+            yield from self.sum_adjacent(
+                (tuple([row[column] for column in key_fields]),
+                 [float(row[column]) for column in value_columns])
+                for row in rows)
+            return
+
+        sorted_fields = self._sorted
+
+        self._results = {}
+        runs = []
+        primary_indexes = None
         for row in data_iterator:
-            for i in range(0, self._sorted_len):
-                if row[i] != self._primary_indexes[i]:
-                    yield from self.transform_results_recursive(self._results, self._primary_indexes)
-
-                    # now reset the results:
-                    self._results = {}
+            current_indexes = [row[column] for column in sorted_fields]
+            if current_indexes != primary_indexes:
+                if primary_indexes is not None:
+                    yield from self.transform_results(self._results, runs)
 
-                    # and change the primary indexes
-                    for j in range(0, self._sorted_len):
-                        self._primary_indexes[j] = row[self._sorted[j]]
+                # now reset the results and the primary indexes
+                self._results = {}
+                runs = []
+                primary_indexes = current_indexes
+                self._primary_indexes = current_indexes
 
             # at this point, all sorted keys match so we need to
             # memorize secondary (non-sorted) indexes
-            #pdb.set_trace()
-            resultref = self._results
-            for i in range(0, self._non_sorted_len - 1):
-                if row[self._non_sorted[i]] not in resultref:
-                    resultref[row[self._non_sorted[i]]] = {}
-                resultref = resultref[row[self._non_sorted[i]]]
-
-
-            # resultref now is the depth-most pointer to where to store value data
-            #pdb.set_trace()
-            last_key = self._non_sorted[self._non_sorted_len - 1]
-            if row[last_key] not in resultref:
-                resultref[row[last_key]] = []
-                resultref = resultref[row[last_key]]
-                for i in range(0, self._value_columns_len):
-                    resultref.append(float(row[self._value_columns[i]]))
+            keys = tuple([row[column] for column in key_fields])
+            values = self._results.get(keys)
+            if values is None:
+                if len(self._results) >= self._max_memory_rows:
+                    runs.append(write_run(sorted(self._results.items(), key=self.record_key),
+                                          self._temp_directory))
+                    self._results = {}
+                self._results[keys] = [float(row[column]) for column in value_columns]
             else:
-                resultref = resultref[row[last_key]]
                 for i in range(0, self._value_columns_len):
-                    resultref[i] += float(row[self._value_columns[i]])
-                
-                    
-        yield from self.transform_results_recursive(self._results, self._primary_indexes)
+                    values[i] += float(row[value_columns[i]])
+
+        if primary_indexes is not None:
+            yield from self.transform_results(self._results, runs)
+        self._results = {}
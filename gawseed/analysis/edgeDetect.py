@@ -1,13 +1,154 @@
 import gawseed.analysis
 import gawseed.averageWindow
+import gawseed.changeDetectors
 import collections
+import multiprocessing
+import os
+import pickle
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# allow setting of this
+MIN_INTERESTING = .000001
+
+# the per-key detectors an analyzeColumns 'algorithm' can select,
+# created as factory(window_size, middle_size, column_info)
+ALGORITHMS = {
+    'window': lambda window_size, middle_size, column_info:
+        gawseed.averageWindow.AverageWindow(window_size, middle_size),
+    'ewma': lambda window_size, middle_size, column_info:
+        gawseed.changeDetectors.EWMAWindow(window_size, middle_size),
+    'cusum': lambda window_size, middle_size, column_info:
+        gawseed.changeDetectors.CUSUMWindow(window_size, middle_size,
+                                            float(column_info.get('drift', 0.0))),
+}
+
+# the attributes holding the state of a running process() loop
+CHECKPOINT_ATTRIBUTES = ['_step', '_recent', '_key_order', '_key_count', '_first_steps',
+                         '_lhs_schedule', '_lhs_live', '_lhs_until',
+                         '_idle_evictions', '_capacity_evictions']
+WINDOW_CHECKPOINT_ATTRIBUTES = ['_windows', '_window_steps']
+BANK_CHECKPOINT_ATTRIBUTES = ['_banks', '_key_rows', '_keys',
+                              '_released_rows', '_free_rows', '_row_steps']
+
+_worker_detector = None
+
+def _init_worker(detector):
+    global _worker_detector
+    _worker_detector = detector
+
+def _process_group(reduced_rows, value_column):
+    idle_evictions = _worker_detector.idle_evictions
+    capacity_evictions = _worker_detector.capacity_evictions
+    events = list(_worker_detector.process_group(reduced_rows, value_column))
+    return (events,
+            _worker_detector.idle_evictions - idle_evictions,
+            _worker_detector.capacity_evictions - capacity_evictions)
 
 class EdgeDetect(gawseed.analysis.Analysis):
+    """Detects edges (sudden rises or falls) in the time series of
+       each key's columns, by comparing the totals of a sliding
+       window on each side of every timestep.
+
+       When vectorized (or 'vectorized: true' in the edgeDetect YAML
+       section) is set, the windows of every key are stored in a
+       gawseed.averageWindow.AverageWindowBank per column, so each
+       timestep's data is added to every window and checked against
+       the thresholds with NumPy array operations.  The results are
+       identical.  This requires numpy to be installed.
+
+       Similarly, when batch (or 'batch: true') is set, each group of
+       rows given to reducer_edge_detect() is analyzed all at once by
+       detect_series(), which calculates the window totals of every
+       timestep from cumulative sums rather than one row at a time.
+       A list of window sizes to look for edges at can be given too:
+
+         edgeDetect:
+           windows:
+             - windowSize: 5
+             - windowSize: 60
+               middleSize: 10
+
+       Each group's rows are then parsed just once and analyzed at
+       every scale by detect_scales(), with a 'windows' column saying
+       which scale (as window_size/middle_size) found each event.
+
+       Instead of an AverageWindow, a column can be analyzed with a
+       detector from gawseed.changeDetectors that keeps just a few
+       floats per key, by setting its analyzeColumns 'algorithm' to
+       'ewma' or 'cusum' (which also takes a 'drift').  Their lhs,
+       rhs, scale and delta output has the same meaning.  These only
+       work with the (non vectorized, non batch) edge_detect_loop().
+       Since they keep decaying after a key's data stops, their keys
+       are never idle evicted and are analyzed at every timestep.
+
+       Keys whose windows hold nothing but zeros can't produce an
+       event, so they are forgotten (and counted in idle_evictions)
+       until they have data again.  A max_keys (or 'maxKeys' YAML)
+       limit additionally evicts the keys that least recently had
+       nonzero data whenever a new key would exceed it, counting
+       them in capacity_evictions.  Within a timestep events are
+       output in the order their keys were first seen, which an idle
+       evicted key keeps (a key evicted by max_keys is new again when
+       it comes back).  Of the keys still remembered,
+       only those with nonzero data in their lhs or rhs windows (see
+       dirty_keys()) are analyzed at each timestep.
+
+       Events can be appended to an output object with edge_detect()
+       or edge_detect_loop(), or be yielded as soon as each timestep
+       is analyzed by process(), which lets edge detection run
+       directly on the rows of another analysis:
+
+         ed.set_parameters([3], time_column=0, key_column=1, ...)
+         for event in ed.process(relationship_analysis.process(rows)):
+             ...
+
+       Setting checkpoint_file (or 'checkpointFile') makes process()
+       save all of its windows to that file every checkpoint_interval
+       ('checkpointInterval', 60 by default) timesteps, after that
+       timestep's events have been yielded, and again once the input
+       runs out.  A later process() with the same settings restores
+       them and skips the rows from before the checkpoint, so a
+       restarted job picks up where the checkpoint left off without
+       re-reading the window history.  The rows for a timestep should
+       not be split across separate inputs.  Events yielded after the
+       last checkpoint are yielded again by the restarted job, so
+       edge_detect_loop() only appends events to its output as each
+       checkpoint is saved.  Checkpoints are pickled, so loading one
+       can run arbitrary code: the checkpoint file must only ever be
+       somewhere that just the job itself can write.
+    """
     def __init__(self, yaml_specification=None):
         self._debug_output = False
         self._analyze_column_list = []
         self._analyze_columns = {}
+        self._vectorized = False
+        self._batch = False
+        self._decaying = False
+        self._scales = []
+        self._checkpoint_file = None
+        self._checkpoint_interval = 60
+        self._checkpoint_step = 0
+        self._max_keys = None
+        self._idle_evictions = 0
+        self._capacity_evictions = 0
+        self._time_column_name = None
+        self._key_column_name = None
         super().__init__(None, None, yaml_specification)
+
+    @property
+    def idle_evictions(self):
+        "The number of keys forgotten because their windows were all zeros."
+        return self._idle_evictions
+
+    @property
+    def capacity_evictions(self):
+        "The number of keys forgotten to stay within max_keys."
+        return self._capacity_evictions
     
     def debug(self, it):
         if self._debug_output:
@@ -24,7 +165,10 @@ class EdgeDetect(gawseed.analysis.Analysis):
                        bin_size=None, time_column=None, key_column=None,
                        zero_jump=None, scale_height=None,
                        window_size=None, middle_size=None, 
-                       sort_first=False, min_value=None, input_fsdb=None):
+                       sort_first=False, min_value=None, input_fsdb=None,
+                       vectorized=None, max_keys=None, batch=None,
+                       windows=None, checkpoint_file=None,
+                       checkpoint_interval=None):
         yaml_specification = self._specification or collections.defaultdict(lambda: None)
 
         if yaml_specification and 'edgeDetect' in self._specification:
@@ -71,12 +215,37 @@ class EdgeDetect(gawseed.analysis.Analysis):
         self._window_size = self.get_value(window_size, 'windowSize', edge_specification)
         self._middle_size = self.get_value(middle_size, 'middleSize', edge_specification)
 
+        # an optional list of window sizes to detect edges at together
+        self._scales = []
+        for scale in self.get_value(windows, 'windows', edge_specification) or []:
+            if type(scale) is dict:
+                scale = (scale['windowSize'], scale.get('middleSize', 0))
+            self._scales.append((int(scale[0]), int(scale[1])))
+        if self._scales and numpy is None:
+            raise ValueError("a list of edgeDetect windows requires numpy to be installed")
+        if self._scales and self._window_size is None:
+            (self._window_size, self._middle_size) = self._scales[0]
+
         # calculate the event time offset
         self._event_offset = (self._window_size * 2 + self._middle_size - 1) * self._bin_size
 
         # need to multiply by the window size
         self._min_value = self.get_value(min_value, 'minValue', edge_specification, 0.0)
 
+        self._vectorized = bool(self.get_value(vectorized, 'vectorized', edge_specification, False))
+        if self._vectorized and numpy is None:
+            raise ValueError("vectorized edgeDetect requires numpy to be installed")
+
+        self._max_keys = self.get_value(max_keys, 'maxKeys', edge_specification)
+
+        self._checkpoint_file = self.get_value(checkpoint_file, 'checkpointFile', edge_specification)
+        self._checkpoint_interval = int(self.get_value(checkpoint_interval, 'checkpointInterval',
+                                                       edge_specification, 60))
+
+        self._batch = bool(self.get_value(batch, 'batch', edge_specification, False))
+        if self._batch and numpy is None:
+            raise ValueError("batch edgeDetect requires numpy to be installed")
+
         analyze_column_list = self.set_column_parameters(analyze_column_list,
                                                          input_fsdb)
 
@@ -126,6 +295,10 @@ class EdgeDetect(gawseed.analysis.Analysis):
                 column_info['scaleHeight'] = self._scale_height
             if 'minValue' not in column_info:
                 column_info['minValue'] = self._min_value
+            if 'algorithm' not in column_info:
+                column_info['algorithm'] = 'window'
+            if column_info['algorithm'] not in ALGORITHMS:
+                raise ValueError("unknown edgeDetect algorithm '%s' for column %s" % (column_info['algorithm'], column))
             # need to multiply by the window size since
             # the averaging window returns window totals
             column_info['minValue'] *= self._window_size
@@ -144,6 +317,20 @@ class EdgeDetect(gawseed.analysis.Analysis):
         self._analyze_column_list = new_list
         return new_list
 
+    def new_window(self, column):
+        """Creates a new window for a key's column, using the
+           column's analyzeColumns 'algorithm' (AverageWindow by
+           default)."""
+        column_info = self._analyze_columns[column]
+        return ALGORITHMS[column_info['algorithm']](self._window_size, self._middle_size,
+                                                    column_info)
+
+    def _window_algorithms_only(self, analyze_column_list, mode):
+        for column in analyze_column_list:
+            algorithm = self._analyze_columns[column].get('algorithm', 'window')
+            if algorithm != 'window':
+                raise ValueError("the %s algorithm (for column %s) can not be used with %s edge detection" % (algorithm, column, mode))
+
     def edge_detect(self, f, outf, analyze_column_list=None,
                     bin_size=None, time_column=None, key_col=None,
                     zero_jump=None, scale_height=None,
@@ -155,21 +342,8 @@ class EdgeDetect(gawseed.analysis.Analysis):
                                                   zero_jump, scale_height,
                                                   window_size, middle_size, 
                                                   sort_first, input_fsdb = f)
-
-        # convert column names to numbers,
-        # and create output columns
-        analyze_cols = []
-        output_columns = []
-        for analyze in analyze_column_list:
-            if type(analyze) is dict:
-                import pdb ; pdb.set_trace()
-            column_info = self._analyze_columns[analyze]
-            analyze_cols.append(column_info['column'])
-            
-            output_columns.append(analyze + "_lhs")
-            output_columns.append(analyze + "_rhs")
-            output_columns.append(analyze + "_scale")
-            output_columns.append(analyze + "_delta")
+        if self._scales:
+            raise ValueError("a list of edgeDetect windows can only be used with reducer_edge_detect() or detect_scales()")
 
         self._time_column_name = ""
         self._key_column_name = ""
@@ -183,13 +357,64 @@ class EdgeDetect(gawseed.analysis.Analysis):
         (self._time_column_name, self._time_column) = self.convert_argument_specifier(self._time_column, f)
         (self._key_column_name, self._key_column) = self.convert_argument_specifier(self._key_column, f)
 
-        outf.out_column_names = [self._time_column_name, self._key_column_name] + output_columns
+        outf.out_column_names = self.column_names(analyze_column_list)
 
         self.edge_detect_loop(f, outf, analyze_column_list)
 
+    def column_names(self, analyze_column_list=None):
+        "Returns the names of the columns in each event row."
+        if not analyze_column_list or len(analyze_column_list) <= 0:
+            analyze_column_list = self._analyze_column_list
+
+        output_columns = [self._time_column_name or 'timestamp',
+                          self._key_column_name or 'key']
+        for analyze in analyze_column_list:
+            output_columns.append(analyze + "_lhs")
+            output_columns.append(analyze + "_rhs")
+            output_columns.append(analyze + "_scale")
+            output_columns.append(analyze + "_delta")
+        return output_columns
+
     def edge_detect_loop(self, f, outf, analyze_column_list,
                          sort_first=False):
-        
+        """Runs process() over f, appending each event row to outf.
+           With a checkpoint file, events are held back and only
+           appended (and flushed) just before the next checkpoint is
+           saved, so the output always ends exactly where the
+           checkpoint does."""
+        if not self._checkpoint_file:
+            for row in self.process(f, analyze_column_list, sort_first):
+                outf.append(row)
+            return
+
+        pending = []
+        def commit():
+            for row in pending:
+                outf.append(row)
+            del pending[:]
+            out_file_handle = getattr(outf, 'out_file_handle', None)
+            if out_file_handle:
+                out_file_handle.flush()
+
+        for row in self.process(f, analyze_column_list, sort_first,
+                                before_checkpoint=commit):
+            pending.append(row)
+
+    def process(self, data_iterator, analyze_column_list=None,
+                sort_first=False, before_checkpoint=None):
+        """Runs edge detection over the rows in data_iterator (sorted
+           by time), yielding each event row as soon as its timestep
+           has been analyzed.  The time, key and analyzed columns must
+           already be column numbers, or set_parameters() must have
+           been given an input_fsdb to look their names up in.
+
+           When checkpointing, before_checkpoint() is called just
+           before each checkpoint is saved, after every event that
+           precedes it has been yielded.  A restarted job yields the
+           events after the checkpoint again, so whatever stores the
+           events should only commit them there (as
+           edge_detect_loop() does)."""
+        f = data_iterator
         if not analyze_column_list or len(analyze_column_list) <= 0:
             analyze_column_list = self._analyze_column_list
         else:
@@ -209,92 +434,316 @@ class EdgeDetect(gawseed.analysis.Analysis):
             # replace our fsdb accessor with the new sorted array
             f = out
 
-        # storage for most recently seen data
-        data_seen = {}
+        if self._vectorized:
+            self._window_algorithms_only(analyze_column_list, "vectorized")
+            yield from self.process_vectorized(f, analyze_column_list,
+                                               before_checkpoint)
+            return
+
+        # other algorithms can still have events once data leaves the rhs
+        self._decaying = any([self._analyze_columns[column]['algorithm'] != 'window'
+                              for column in analyze_column_list])
+
         # storage dictionary to store window data in
         windows = {}
+        self._windows = windows
+        # the number of timesteps each key's windows hold, since
+        # missing zeros are only added once the key is used again
+        self._window_steps = {}
+        # the number of the current timestep
+        self._step = 0
+        self._reset_recent()
         # the initial timestamp that we can even begin running edge detection
         first_analysis_time = None
-        # min time before we start event signals
-        # based on the beginning data, None until then
-        min_time = None
         last_time = None
+        # rows before this were handled before the checkpoint was saved
+        resume_time = None
+
+        restored = self.load_checkpoint(analyze_column_list)
+        if restored:
+            (first_analysis_time, last_time, resume_time) = restored
+            windows = self._windows
 
         # loop over all data
         for row in f:
             key = row[self._key_column]
             time = int(row[self._time_column])
+            if resume_time is not None and time < resume_time:
+                continue
             values = {}
             for column in analyze_column_list:
                 column_info = self._analyze_columns[column]
-                if len(row) > column_info['column'] and row[column_info['column']] is not None and row[column_info['column']] is not "":
+                if len(row) > column_info['column'] and row[column_info['column']] is not None and row[column_info['column']] != "":
                     values[column] = float(row[column_info['column']])
             
             if not first_analysis_time:
                 first_analysis_time = time + self._bin_size * (self._window_size * 2 + self._middle_size)
                 last_time = time
-                next
 
             if last_time != time:
-                # add missing zeros
-                self.debug("#+ data_seen: " + str(data_seen))
-                for wkey in windows:
-                    for column in analyze_column_list:
-                        column_info = self._analyze_columns[column]
-                        if wkey not in data_seen or column not in data_seen[wkey]:
-                            self.debug("#+ missing data: %s/%s" % (wkey,column))
-                            windows[wkey][column].add_element(0.0)
-                        else:
-                            self.debug("#+ had data: %s/%s" % (wkey,column))
-                data_seen = {}
-
-                # for anything in the bin window
-                # add zeros for (time - last_time)/bin slots
+                # move to the next timestep, skipping over any that
+                # were missing (whose zeros will be added lazily)
                 self.debug("#jumping " + str(last_time) + " -> " + str(time))
                 last_time += self._bin_size
                 if (last_time > time):
                     raise ValueError("bin size must be incorrect; jumped too far: new last_time=%d > time=%d; -- maybe incoming data was not sorted by time???" % (last_time, time))
+                self._step += 1
                 while last_time < time:
-                    self.debug("catching up " + str(last_time))
-                    for wkey in windows:
-                        for column in windows[wkey]:
-                            windows[wkey][column].add_element(0.0)
                     # XXX: we should analyze here to avoid missing downspikes
                     last_time += self._bin_size
+                    self._step += 1
+
+                self.evict_idle()
 
                 # don't analyze too early
                 if time >= first_analysis_time:
-                    self.analyze_windows(time, windows,
-                                         outf)
+                    yield from self.detect_windows(time, windows,
+                                                   keys=self.dirty_keys())
+
+                if self._checkpoint_file and \
+                   self._step - self._checkpoint_step >= self._checkpoint_interval:
+                    if before_checkpoint:
+                        before_checkpoint()
+                    self.save_checkpoint(first_analysis_time, last_time, time)
 
             if key not in windows:
-                # need to play catchup
-                #print("creating key " + key)
+                self._add_recent(key)
                 windows[key] = {}
                 for column in analyze_column_list:
-                    column_info = self._analyze_columns[column]
-                    windows[key][column] = averageWindow.AverageWindow(self._window_size, self._middle_size)
+                    windows[key][column] = self.new_window(column)
+                self._window_steps[key] = self._step
+
+            for value in values.values():
+                if value != 0.0:
+                    self._touch_recent(key)
+                    break
+
+            # a second row for a key in the same timestep adds another element
+            if self._window_steps[key] <= self._step:
+                self.catch_up(key, windows[key])
+                self._window_steps[key] = self._step + 1
+            else:
+                self._shift_recent(key)
 
             for column in analyze_column_list:
-                column_info = self._analyze_columns[column]
                 if column in values:
                     windows[key][column].add_element(values[column])
                 else:
                     windows[key][column].add_element(0.0)
-                if key not in data_seen:
-                    data_seen[key] = {}
-                data_seen[key][column] = 1
-                #self.debug("#+ %s:\t%f\t%f\t%f" % (key, values[column['name']], windows[key][column['name']].get_lhs(), windows[key][column['name']].get_rhs()))
 
-                
-    def analyze_windows(self, time, windows, outf,
-                        analyze_column_list=None):
-        MIN_INTERESTING = .000001 # allow setting of this
+        if self._checkpoint_file and last_time is not None:
+            # everything up to the last time has now been handled
+            if before_checkpoint:
+                before_checkpoint()
+            self.save_checkpoint(first_analysis_time, last_time, last_time + 1)
+
+    def _checkpoint_settings(self, analyze_column_list):
+        return (self._window_size, self._middle_size, self._bin_size,
+                bool(self._vectorized),
+                [(column, self._analyze_columns[column]['column'],
+                  self._analyze_columns[column].get('algorithm', 'window'))
+                 for column in analyze_column_list])
+
+    def _checkpoint_attributes(self):
+        if self._vectorized:
+            return CHECKPOINT_ATTRIBUTES + BANK_CHECKPOINT_ATTRIBUTES
+        return CHECKPOINT_ATTRIBUTES + WINDOW_CHECKPOINT_ATTRIBUTES
+
+    def save_checkpoint(self, first_analysis_time, last_time, resume_time):
+        """Saves the state of the running process() loop to the
+           checkpoint file (compressed and pickled), replacing the old
+           one only once the new one is completely written.  Rows
+           before resume_time are skipped when it's restored."""
+        state = {'settings': self._checkpoint_settings(self._analyze_column_list),
+                 'first_analysis_time': first_analysis_time,
+                 'last_time': last_time,
+                 'resume_time': resume_time}
+        for name in self._checkpoint_attributes():
+            state[name] = getattr(self, name)
+
+        temporary_file = self._checkpoint_file + ".tmp"
+        with open(temporary_file, "wb") as checkpoint:
+            checkpoint.write(zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL)))
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+        os.replace(temporary_file, self._checkpoint_file)
+        self._checkpoint_step = self._step
+
+    def load_checkpoint(self, analyze_column_list=None):
+        """Restores the state saved by save_checkpoint(), returning
+           (first_analysis_time, last_time, resume_time), or None when
+           there's no checkpoint file to restore.  The file is
+           unpickled, so it must come from a trusted source."""
+        self._checkpoint_step = 0
+        if not self._checkpoint_file or not os.path.exists(self._checkpoint_file):
+            return None
+        if not analyze_column_list or len(analyze_column_list) <= 0:
+            analyze_column_list = self._analyze_column_list
 
+        with open(self._checkpoint_file, "rb") as checkpoint:
+            state = pickle.loads(zlib.decompress(checkpoint.read()))
+        if state['settings'] != self._checkpoint_settings(analyze_column_list):
+            raise ValueError("checkpoint file %s was saved with different edgeDetect settings" % (self._checkpoint_file))
+
+        for name in self._checkpoint_attributes():
+            setattr(self, name, state[name])
+        self._checkpoint_step = self._step
+        return (state['first_analysis_time'], state['last_time'], state['resume_time'])
+
+    def _reset_recent(self):
+        # keys ordered by the last timestep they had nonzero data in
+        self._recent = collections.OrderedDict()
+        # the order keys were first seen in, which events are output in
+        # (idle evicted keys keep their place for when they come back)
+        self._key_order = {}
+        self._key_count = 0
+        # the step each key was first seen at, less one for every extra
+        # element its duplicate rows added (see _young())
+        self._first_steps = {}
+        # keys that will have nonzero data reach their lhs window at
+        # a given timestep, keys that may have nonzero data in it now,
+        # and the last timestep each key's nonzero data can be there
+        self._lhs_schedule = {}
+        self._lhs_live = set()
+        self._lhs_until = {}
+
+    def _add_recent(self, key):
+        "Starts tracking a new key, evicting another if max_keys is reached."
+        if self._max_keys and len(self._recent) >= self._max_keys:
+            (old_key, last_step) = self._recent.popitem(last=False)
+            self._evict(old_key)
+            del self._key_order[old_key]
+            del self._first_steps[old_key]
+            self._capacity_evictions += 1
+
+        # without any nonzero data yet it's the first to go
+        self._recent[key] = self._step - (self._window_size * 2 + self._middle_size)
+        self._recent.move_to_end(key, last=False)
+        if key not in self._key_order:
+            self._key_order[key] = self._key_count
+            self._key_count += 1
+            self._first_steps[key] = self._step
+
+    def _touch_recent(self, key):
+        "Records that a key had nonzero data in the current timestep."
+        if self._recent[key] != self._step:
+            # this data reaches the lhs window once it's passed
+            # through both the rhs and middle windows
+            lhs_step = self._step + self._window_size + self._middle_size + 1
+            self._lhs_schedule.setdefault(lhs_step, set()).add(key)
+            self._lhs_until[key] = self._step + self._window_size * 2 + self._middle_size
+        self._recent[key] = self._step
+        self._recent.move_to_end(key)
+
+    def _shift_recent(self, key):
+        """Records that a key got an extra element in the current
+           timestep, which pushes its older data toward the lhs window
+           sooner than scheduled."""
+        self._first_steps[key] -= 1
+        if key in self._lhs_until:
+            self._lhs_live.add(key)
+
+    def dirty_keys(self):
+        """Returns the keys whose lhs or rhs windows may hold nonzero
+           data at the current timestep, in the order they were first seen.
+           Every other key has all zero windows on both sides, which
+           can't produce an event, so these are the only keys
+           analyze_windows() needs to look at.  Decaying detectors
+           (ewma and cusum) can produce events long after their data
+           stops, so with them every key is returned."""
+        if self._decaying:
+            return sorted(self._recent, key=self._key_order.__getitem__)
+
+        step = self._step
+        live = self._lhs_live
+        for lhs_step in [lhs_step for lhs_step in self._lhs_schedule if lhs_step <= step]:
+            live.update(self._lhs_schedule.pop(lhs_step))
+
+        lhs_until = self._lhs_until
+        for key in [key for key in live if lhs_until.get(key, -1) < step]:
+            live.discard(key)
+
+        dirty = set(live)
+        oldest_rhs = step - self._window_size
+        for key in reversed(self._recent):
+            if self._recent[key] < oldest_rhs:
+                break
+            dirty.add(key)
+
+        return sorted(dirty, key=self._key_order.__getitem__)
+
+    def _young(self, key):
+        """Returns True while the elements a key's AverageWindows have
+           held since it was first seen haven't reached the lhs window
+           yet, which still holds the integer 0s it was seeded with."""
+        return self._step - self._first_steps[key] <= self._window_size + self._middle_size
+
+    def _lhs_string(self, key, lhs):
+        "Formats an lhs total the way an AverageWindow's prints."
+        if self._young(key):
+            return '0'
+        return str(float(lhs))
+
+    def evict_idle(self):
+        """Forgets every key that hasn't had any nonzero data within
+           its windows, since an all zero window can't produce an
+           event.  Decaying detectors never hold all zero windows, so
+           with them keys are only evicted by max_keys."""
+        if self._decaying:
+            return
+
+        oldest = self._step - (self._window_size * 2 + self._middle_size)
+        recent = self._recent
+        while recent:
+            key = next(iter(recent))
+            if recent[key] >= oldest:
+                break
+            del recent[key]
+            self._evict(key)
+            self._idle_evictions += 1
+
+    def _evict(self, key):
+        self.debug("#+ evicting: %s" % (key))
+        self._lhs_until.pop(key, None)
+        self._lhs_live.discard(key)
+        if self._vectorized:
+            row = self._key_rows.pop(key)
+            self._keys[row] = None
+            self._released_rows.append(row)
+        else:
+            del self._windows[key]
+            del self._window_steps[key]
+
+    def catch_up(self, key, key_windows):
+        """Adds the zeros for the timesteps a key had no data in to
+           its windows, so they hold every timestep before the current
+           one."""
+        missing = self._step - self._window_steps.get(key, self._step)
+        if missing > 0:
+            self.debug("#+ missing data: %s x %d" % (key, missing))
+            for window in key_windows.values():
+                window.add_zeros(missing)
+            self._window_steps[key] = self._step
+
+    def analyze_windows(self, time, windows, outf,
+                        analyze_column_list=None, keys=None):
+        """Checks the windows of each key (or only those in keys) for
+           events, appending a row to outf for each one found."""
+        for row in self.detect_windows(time, windows, analyze_column_list, keys):
+            outf.append(row)
+
+    def detect_windows(self, time, windows, analyze_column_list=None,
+                       keys=None):
+        """Checks the windows of each key (or only those in keys) for
+           events, yielding a row for each one found."""
         if not analyze_column_list or len(analyze_column_list) <= 0:
             analyze_column_list = self._analyze_column_list
 
-        for aw_name in windows:
+        if keys is None:
+            keys = windows
+
+        for aw_name in keys:
+            self.catch_up(aw_name, windows[aw_name])
             print_all = False # self.debugging
             any_event = False
             results = {}
@@ -348,13 +797,434 @@ class EdgeDetect(gawseed.analysis.Analysis):
                 for column in windows[aw_name]:
                     colstr = str(column)
                     aw = windows[aw_name][column]
+                    lhs = str(aw.get_lhs())
+                    if self._analyze_columns[column]['algorithm'] == 'window':
+                        # evicted keys come back with fresh windows
+                        lhs = self._lhs_string(aw_name, aw.get_lhs())
 
-                    row = row + [str(aw.get_lhs()),
+                    row = row + [lhs,
                                  str(aw.get_rhs()),
                                  str(results[colstr + '_scale_event']),
                                  str(results[colstr + '_delta_event'])]
 
-                outf.append(row)
+                yield row
+
+    def catch_up_banks(self, banks, rows):
+        """Adds the zeros for the timesteps each of the (unique) bank
+           rows had no data in, so they hold every timestep before the
+           current one."""
+        missing = self._step - self._row_steps[rows]
+        for bank in banks.values():
+            bank.add_zeros(rows, missing)
+        self._row_steps[rows] = self._step
+
+    def _add_bin_to_banks(self, banks, bin_rows, analyze_column_list):
+        """Adds a timestep's collected (bank row, values) pairs to the
+           banks.  Rows seen more than once get their extra elements
+           added afterward, just as edge_detect_loop() does one row at
+           a time."""
+        layers = []
+        seen = {}
+        for (bank_row, values) in bin_rows:
+            count = seen.get(bank_row, 0)
+            seen[bank_row] = count + 1
+            if count == len(layers):
+                layers.append(([], []))
+            layers[count][0].append(bank_row)
+            layers[count][1].append(values)
+
+        if not layers:
+            return
+
+        # forget rows for keys evicted during this timestep
+        if self._released_rows:
+            for layer in layers:
+                kept = [number for (number, bank_row) in enumerate(layer[0])
+                        if self._keys[bank_row] is not None]
+                layer[0][:] = [layer[0][number] for number in kept]
+                layer[1][:] = [layer[1][number] for number in kept]
+            layers = [layer for layer in layers if layer[0]]
+            if not layers:
+                return
+
+        for (layer_rows, layer_values) in layers[1:]:
+            for bank_row in layer_rows:
+                self._shift_recent(self._keys[bank_row])
+
+        self.catch_up_banks(banks, numpy.array(layers[0][0], dtype=numpy.int64))
+        for (column_number, column) in enumerate(analyze_column_list):
+            bank = banks[column]
+            for (layer_rows, layer_values) in layers:
+                bank.add_elements(layer_rows, [row_values[column_number] for row_values in layer_values])
+        self._row_steps[layers[0][0]] = self._step + 1
+
+    def process_vectorized(self, f, analyze_column_list, before_checkpoint=None):
+        """The same as process(), but collects each timestep's rows so
+           they can be added to AverageWindowBanks at once."""
+        window_size = self._window_size
+        middle_size = self._middle_size
+        banks = {}
+        for column in analyze_column_list:
+            banks[column] = gawseed.averageWindow.AverageWindowBank(window_size, middle_size)
+        self._banks = banks
+
+        # the bank row number for each key, and the key for each row
+        key_rows = {}
+        keys = []
+        self._key_rows = key_rows
+        self._keys = keys
+        # rows of evicted keys, which are reused once the timestep ends
+        self._released_rows = []
+        free_rows = []
+        self._free_rows = free_rows
+        # the number of timesteps held by each row's windows
+        self._row_steps = numpy.zeros(1024, dtype=numpy.int64)
+        self._step = 0
+        self._reset_recent()
+        bin_rows = []
+        first_analysis_time = None
+        last_time = None
+        resume_time = None
+
+        restored = self.load_checkpoint(analyze_column_list)
+        if restored:
+            (first_analysis_time, last_time, resume_time) = restored
+            (banks, key_rows, keys, free_rows) = (self._banks, self._key_rows,
+                                                  self._keys, self._free_rows)
+
+        columns = [self._analyze_columns[column]['column'] for column in analyze_column_list]
+
+        for row in f:
+            key = row[self._key_column]
+            time = int(row[self._time_column])
+            if resume_time is not None and time < resume_time:
+                continue
+            values = []
+            for column_number in columns:
+                if len(row) > column_number and row[column_number] is not None and row[column_number] != "":
+                    values.append(float(row[column_number]))
+                else:
+                    values.append(0.0)
+
+            if not first_analysis_time:
+                first_analysis_time = time + self._bin_size * (window_size * 2 + middle_size)
+                last_time = time
+
+            if last_time != time:
+                self._add_bin_to_banks(banks, bin_rows, analyze_column_list)
+                bin_rows = []
+                free_rows.extend(self._released_rows)
+                self._released_rows = []
+
+                # move to the next timestep, skipping over any that
+                # were missing (whose zeros will be added lazily)
+                last_time += self._bin_size
+                if (last_time > time):
+                    raise ValueError("bin size must be incorrect; jumped too far: new last_time=%d > time=%d; -- maybe incoming data was not sorted by time???" % (last_time, time))
+                self._step += 1
+                while last_time < time:
+                    last_time += self._bin_size
+                    self._step += 1
+
+                self.evict_idle()
+                free_rows.extend(self._released_rows)
+                self._released_rows = []
+
+                # don't analyze too early
+                if time >= first_analysis_time:
+                    yield from self.detect_banks(time, banks, keys, analyze_column_list,
+                                                 rows=[key_rows[key] for key in self.dirty_keys()])
+
+                if self._checkpoint_file and \
+                   self._step - self._checkpoint_step >= self._checkpoint_interval:
+                    if before_checkpoint:
+                        before_checkpoint()
+                    self.save_checkpoint(first_analysis_time, last_time, time)
+
+            if key not in key_rows:
+                self._add_recent(key)
+                if free_rows:
+                    bank_row = free_rows.pop()
+                    for column in analyze_column_list:
+                        banks[column].clear([bank_row])
+                    keys[bank_row] = key
+                else:
+                    for column in analyze_column_list:
+                        bank_row = banks[column].add_row()
+                    keys.append(key)
+                    if bank_row >= len(self._row_steps):
+                        self._row_steps = numpy.concatenate([self._row_steps, numpy.zeros(len(self._row_steps), dtype=numpy.int64)])
+                key_rows[key] = bank_row
+                self._row_steps[bank_row] = self._step
+
+            for value in values:
+                if value != 0.0:
+                    self._touch_recent(key)
+                    break
+
+            bin_rows.append((key_rows[key], values))
+
+        # leave the windows holding the final timestep's data
+        self._add_bin_to_banks(banks, bin_rows, analyze_column_list)
+        free_rows.extend(self._released_rows)
+        self._released_rows = []
+
+        if self._checkpoint_file and last_time is not None:
+            # everything up to the last time has now been handled
+            if before_checkpoint:
+                before_checkpoint()
+            self.save_checkpoint(first_analysis_time, last_time, last_time + 1)
+
+    def analyze_banks(self, time, banks, keys, outf, analyze_column_list=None,
+                      rows=None):
+        """The same as analyze_windows(), but checks the windows of
+           every key (or only the bank rows in rows) in a set of
+           AverageWindowBanks at once."""
+        for row in self.detect_banks(time, banks, keys, analyze_column_list, rows):
+            outf.append(row)
+
+    def detect_banks(self, time, banks, keys, analyze_column_list=None,
+                     rows=None):
+        """The same as detect_windows(), but checks the windows of
+           every key (or only the bank rows in rows) in a set of
+           AverageWindowBanks at once."""
+        if not analyze_column_list or len(analyze_column_list) <= 0:
+            analyze_column_list = self._analyze_column_list
+
+        if rows is None:
+            rows = [self._key_rows[key] for key in
+                    sorted(self._key_rows, key=self._key_order.__getitem__)]
+        rows = numpy.array(rows, dtype=numpy.int64)
+
+        self.catch_up_banks(banks, rows)
+
+        any_event = numpy.zeros(len(rows), dtype=bool)
+        column_results = []
+        for column in analyze_column_list:
+            bank = banks[column]
+            results = self._threshold_events(self._analyze_columns[column],
+                                             bank.lhs[rows], bank.rhs[rows])
+            any_event |= results[2] | results[3]
+            column_results.append(results)
+
+        # calculate a time stamp not based on the current time,
+        # but based on current - window size adjustments
+        real_time = str(time - self._event_offset)
+        # rows are already in the order the keys were first seen
+        for number in numpy.flatnonzero(any_event):
+            bank_row = rows[number]
+            if keys[bank_row] is None:
+                continue
+            key = keys[bank_row]
+            yield [real_time, key] + self._event_values(column_results, number,
+                                                        self._young(key))
+
+    def _threshold_events(self, column_info, lhs, rhs):
+        """Checks arrays of lhs and rhs totals against a column's
+           thresholds, returning (lhs, rhs, delta_events, scale_events,
+           scales) arrays."""
+        min_value = column_info['minValue']
+
+        delta_events = numpy.zeros(len(lhs), dtype=bool)
+        scale_events = numpy.zeros(len(lhs), dtype=bool)
+        scales = numpy.zeros(len(lhs))
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            if column_info['zeroJump']:
+                zero_jump = column_info['zeroJump']
+                # rising or falling from a zero(ish) average
+                rising = (rhs - lhs > zero_jump) & (rhs >= min_value)
+                falling = ~rising & (lhs - rhs > zero_jump) & (lhs >= min_value)
+                delta_events = rising | falling
+
+            if column_info['scaleHeight']:
+                scale_height = column_info['scaleHeight']
+                upward = (lhs > MIN_INTERESTING) & (rhs >= min_value) & (rhs / lhs > scale_height)
+                downward = ~upward & (rhs > MIN_INTERESTING) & (lhs >= min_value) & \
+                    (lhs / rhs > scale_height)
+                scale_events = upward | downward
+                scales = numpy.where(upward, rhs / lhs, numpy.where(downward, -lhs / rhs, 0.0))
+
+        return (lhs, rhs, delta_events, scale_events, scales)
+
+    def _event_values(self, column_results, number, young=False):
+        """Returns the output values of every column for one event,
+           with the lhs printed as 0 for a young key (see _young())."""
+        values = []
+        for (lhs, rhs, delta_events, scale_events, scales) in column_results:
+            lhs_value = lhs[number].item()
+            rhs_value = rhs[number].item()
+            values = values + ['0' if young else str(lhs_value),
+                               str(rhs_value),
+                               str(scales[number].item()) if scale_events[number] else '0',
+                               str(rhs_value - lhs_value) if delta_events[number] else '0']
+        return values
+
+    def detect_series(self, data_rows, analyze_column_list=None):
+        """The same as process(), for the rows of a single key (such
+           as a group from reduce()).  Rather than adding each row to
+           AverageWindows, the key's values are laid out on a zero
+           filled time axis and the window totals for every timestep
+           are calculated at once with
+           gawseed.averageWindow.window_totals(), which gives
+           identical totals and so identical events.  Rows sharing a
+           timestep or not on a bin_size boundary are simply handed to
+           process() instead."""
+        if not analyze_column_list or len(analyze_column_list) <= 0:
+            analyze_column_list = self._analyze_column_list
+        else:
+            self._analyze_column_list = analyze_column_list
+
+        self._window_algorithms_only(analyze_column_list, "batch")
+        data_rows = sorted(data_rows, key=lambda row: row[self._time_column])
+        series = self._series(data_rows, analyze_column_list)
+        if series is None:
+            yield from self.process(data_rows, analyze_column_list)
+            return
+
+        yield from self._detect_series(series, data_rows[0][self._key_column],
+                                       analyze_column_list,
+                                       self._window_size, self._middle_size)
+
+    def detect_scales(self, data_rows, analyze_column_list=None, scales=None):
+        """Runs detect_series() over the rows of a single key with each
+           of a list of (window_size, middle_size) scales (by default
+           those from the 'windows' YAML list), appending a
+           'window_size/middle_size' value to each event saying which
+           scale found it.  The rows are only parsed and laid out on
+           the time axis once for every scale.  Only the evictions of
+           the first scale are counted, so that each group's are
+           counted once."""
+        if not analyze_column_list or len(analyze_column_list) <= 0:
+            analyze_column_list = self._analyze_column_list
+        else:
+            self._analyze_column_list = analyze_column_list
+        scales = scales or self._scales
+        self._window_algorithms_only(analyze_column_list, "multiple window")
+
+        data_rows = sorted(data_rows, key=lambda row: row[self._time_column])
+        series = self._series(data_rows, analyze_column_list)
+
+        evictions = None
+        for (window_size, middle_size) in scales:
+            scale_name = "%d/%d" % (window_size, middle_size)
+            if series is None:
+                events = self._process_scale(data_rows, analyze_column_list,
+                                             window_size, middle_size)
+            else:
+                events = self._detect_series(series, data_rows[0][self._key_column],
+                                             analyze_column_list,
+                                             window_size, middle_size)
+            for event in events:
+                yield event + [scale_name]
+
+            if evictions is None:
+                evictions = (self._idle_evictions, self._capacity_evictions)
+            else:
+                (self._idle_evictions, self._capacity_evictions) = evictions
+
+    def _process_scale(self, data_rows, analyze_column_list,
+                       window_size, middle_size):
+        "Returns a list of the events process() finds with other window sizes."
+        saved = (self._window_size, self._middle_size, self._event_offset)
+        try:
+            self._window_size = window_size
+            self._middle_size = middle_size
+            self._event_offset = (window_size * 2 + middle_size - 1) * self._bin_size
+            return list(self.process(data_rows, analyze_column_list))
+        finally:
+            (self._window_size, self._middle_size, self._event_offset) = saved
+
+    def _series(self, data_rows, analyze_column_list):
+        """Lays the time sorted rows of a single key out on a time
+           axis, returning (times, steps, values, nonzero,
+           nonzero_counts) arrays, or None if rows share a timestep or
+           aren't on a bin_size boundary."""
+        if len(data_rows) == 0:
+            return None
+
+        times = numpy.array([int(row[self._time_column]) for row in data_rows], dtype=numpy.int64)
+        offsets = times - times[0]
+        if (numpy.diff(times) <= 0).any() or (offsets % self._bin_size).any():
+            return None
+
+        steps = offsets // self._bin_size
+        values = numpy.zeros((len(analyze_column_list), len(data_rows)))
+        for (number, column) in enumerate(analyze_column_list):
+            column_number = self._analyze_columns[column]['column']
+            values[number] = [float(row[column_number])
+                              if len(row) > column_number and row[column_number] is not None and row[column_number] != ""
+                              else 0.0 for row in data_rows]
+        nonzero = (values != 0.0).any(axis=0)
+
+        # the number of rows with nonzero data before each timestep
+        nonzero_counts = numpy.zeros(steps[-1] + 2, dtype=numpy.int64)
+        nonzero_counts[steps + 1] = nonzero
+        nonzero_counts = numpy.cumsum(nonzero_counts)
+
+        return (times, steps, values, nonzero, nonzero_counts)
+
+    def _detect_series(self, series, key, analyze_column_list,
+                       window_size, middle_size):
+        "Yields the events detect_series() finds with the given window sizes."
+        (times, steps, values, nonzero, nonzero_counts) = series
+        total_size = window_size * 2 + middle_size
+        event_offset = (total_size - 1) * self._bin_size
+
+        # the key is evicted at (and its windows restart with) each
+        # row that had no nonzero data within the total_size steps
+        # before it, just like evict_idle()
+        nonzero_steps = numpy.where(nonzero, steps, -total_size - 1)
+        last_nonzero = numpy.concatenate([[-total_size - 1],
+                                          numpy.maximum.accumulate(nonzero_steps)[:-1]])
+        restarts = last_nonzero < steps - total_size
+        self._idle_evictions += int(restarts.sum()) - 1
+
+        def nonzero_between(start, end):
+            return nonzero_counts[end] - nonzero_counts[numpy.maximum(start, 0)]
+
+        # each later row's timestep is analyzed, when the key has
+        # nonzero data in its lhs or rhs windows (see dirty_keys())
+        analyzed = numpy.flatnonzero((steps >= total_size) & ~restarts)
+        at = steps[analyzed]
+        dirty = (nonzero_between(at - window_size, at) > 0) | \
+            (nonzero_between(at - total_size, at - window_size - middle_size) > 0)
+        analyzed = analyzed[dirty]
+        at = at[dirty]
+        if len(analyzed) == 0:
+            return
+
+        # calculate the totals within each run of rows between restarts
+        lhs = numpy.zeros((len(analyze_column_list), len(analyzed)))
+        rhs = numpy.zeros((len(analyze_column_list), len(analyzed)))
+        first_rows = numpy.flatnonzero(restarts)
+        runs = numpy.cumsum(restarts)[analyzed] - 1
+        for numbers in numpy.split(numpy.arange(len(analyzed)),
+                                   numpy.flatnonzero(numpy.diff(runs)) + 1):
+            first_row = first_rows[runs[numbers[0]]]
+            last_row = analyzed[numbers[-1]]
+            start = steps[first_row]
+            elements = numpy.zeros((len(analyze_column_list), at[numbers[-1]] - start))
+            elements[:, steps[first_row:last_row] - start] = values[:, first_row:last_row]
+            for column_number in range(len(analyze_column_list)):
+                (run_lhs, run_rhs) = gawseed.averageWindow.window_totals(elements[column_number],
+                                                                         window_size, middle_size)
+                lhs[column_number, numbers] = run_lhs[at[numbers] - start - 1]
+                rhs[column_number, numbers] = run_rhs[at[numbers] - start - 1]
+
+        any_event = numpy.zeros(len(analyzed), dtype=bool)
+        column_results = []
+        for (column_number, column) in enumerate(analyze_column_list):
+            results = self._threshold_events(self._analyze_columns[column],
+                                             lhs[column_number], rhs[column_number])
+            any_event |= results[2] | results[3]
+            column_results.append(results)
+
+        for number in numpy.flatnonzero(any_event):
+            # calculate a time stamp not based on the current time,
+            # but based on current - window size adjustments
+            real_time = str(times[analyzed[number]].item() - event_offset)
+            yield [real_time, key] + self._event_values(column_results, number)
 
     def map(self, input_data, output_stream,
             column_names=None, column_numbers=None,
@@ -408,7 +1278,8 @@ class EdgeDetect(gawseed.analysis.Analysis):
                             key_column='key',
                             zero_jump=None, scale_height=None,
                             window_size=None, middle_size=None, 
-                            sort_first=False, value_column='value'):
+                            sort_first=False, value_column='value',
+                            workers=None, batch=None, windows=None):
 
         # get column numbers if needed
 
@@ -417,11 +1288,14 @@ class EdgeDetect(gawseed.analysis.Analysis):
                             bin_size, timestamp_column, key_column,
                             zero_jump, scale_height,
                             window_size, middle_size, 
-                            sort_first, input_fsdb=inf)
+                            sort_first, input_fsdb=inf, batch=batch,
+                            windows=windows)
 
         try:
             outf.out_column_names = ['timestamp', 'key', 'lhs',
                                      'rhs', 'scale', 'zero']
+            if self._scales:
+                outf.out_column_names = outf.out_column_names + ['windows']
         except:
             pass # guess it wasn't an fsdb object
 
@@ -429,41 +1303,97 @@ class EdgeDetect(gawseed.analysis.Analysis):
         (self._time_column_name, self._time_column) = self.convert_argument_specifier(self._time_column, inf)
         (self._key_column_name, self._key_column) = self.convert_argument_specifier(self._key_column, inf)
 
+        for row in self.reducer_process(inf, value_column, workers):
+            outf.append(row)
+
+    def reducer_process(self, inf, value_column='value', workers=None):
+        """Runs edge detection over each group of rows returned by
+           reduce(), yielding the event rows of each group in turn.
+           With more than one worker, groups are handed to
+           parallel_reducer_process() instead."""
+        if self._checkpoint_file:
+            raise ValueError("edgeDetect checkpoints can't be used with reducer_edge_detect()")
+
+        if workers and workers > 1:
+            yield from self.parallel_reducer_process(inf, value_column, workers)
+            return
+
         # Start by running the reducer on it to get windows of data to process
         for reduced_rows in self.reduce(inf):
-            # get the column name from the data
             if len(reduced_rows) <= 0:
                 continue # should never happen
 
-            # run edge detection on the existing grouped dataset
-            # making sure to sort it by timestamp, as hadoop/reduce
-            # doesn't sort by a second key
-
-            # we need to change the 'value' column details in the
-            # analyze_columns specifications built generically,
-            # to match the potentially specific specifications
-            # 
-            first_row = reduced_rows[0]
-            comma_index = first_row[self._key_column].index("-")
-            column_name = first_row[self._key_column][0:comma_index]
-            # key_val = first_row[key_column][comma_index+1:]
-
-            # copy the column parameters to the value column
-            # that we're actually analyzing
-            column_lookup = 'col(' + column_name + ')' # XXX: Ick, this is wrong
-
-            # reset to defaults
-            self._analyze_columns[value_column]['zeroJump'] = self._zero_jump
-            self._analyze_columns[value_column]['scaleHeight'] = self._scale_height
-            self._analyze_columns[value_column]['minValue'] = self._min_value
-            # over-ride with yaml specifics
-            if column_lookup in self._column_specifications:
-                col_spec = self._column_specifications[column_lookup]
-                for item in ['zeroJump', 'scaleHeight', 'minValue']:
-                    if item in col_spec:
-                        self._analyze_columns[value_column][item] = col_spec[item]
+            yield from self.process_group(reduced_rows, value_column)
+
+    def parallel_reducer_process(self, inf, value_column='value', workers=2):
+        """Identical to reducer_process(), but ships each group from
+           reduce() to a pool of worker processes.  Events are still
+           returned in the order of the groups, and at most 2 * workers
+           groups are in flight at any time."""
+        pending = collections.deque()
+        pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                    initargs=(self,))
+        try:
+            groups = (reduced_rows for reduced_rows in self.reduce(inf)
+                      if len(reduced_rows) > 0)
+            while True:
+                for reduced_rows in groups:
+                    pending.append(pool.apply_async(_process_group,
+                                                    (reduced_rows, value_column)))
+                    if len(pending) >= 2 * workers:
+                        break
+                if not pending:
+                    break
+
+                (events, idle_evictions, capacity_evictions) = pending.popleft().get()
+                self._idle_evictions += idle_evictions
+                self._capacity_evictions += capacity_evictions
+                yield from events
+        finally:
+            pool.terminate()
+
+    def process_group(self, reduced_rows, value_column='value'):
+        """Runs edge detection on a single group of rows from
+           reduce(), using the YAML settings for the group's column."""
+        # run edge detection on the existing grouped dataset
+        # making sure to sort it by timestamp, as hadoop/reduce
+        # doesn't sort by a second key
+
+        # we need to change the 'value' column details in the
+        # analyze_columns specifications built generically,
+        # to match the potentially specific specifications
+        # 
+        first_row = reduced_rows[0]
+        comma_index = first_row[self._key_column].index("-")
+        column_name = first_row[self._key_column][0:comma_index]
+        # key_val = first_row[key_column][comma_index+1:]
+
+        # copy the column parameters to the value column
+        # that we're actually analyzing
+        column_lookup = 'col(' + column_name + ')' # XXX: Ick, this is wrong
+
+        # reset to defaults
+        self._analyze_columns[value_column]['zeroJump'] = self._zero_jump
+        self._analyze_columns[value_column]['scaleHeight'] = self._scale_height
+        self._analyze_columns[value_column]['minValue'] = self._min_value
+        self._analyze_columns[value_column]['algorithm'] = 'window'
+        self._analyze_columns[value_column].pop('drift', None)
+        # over-ride with yaml specifics
+        if column_lookup in self._column_specifications:
+            col_spec = self._column_specifications[column_lookup]
+            for item in ['zeroJump', 'scaleHeight', 'minValue', 'algorithm', 'drift']:
+                if item in col_spec:
+                    self._analyze_columns[value_column][item] = col_spec[item]
+                    
+        if self._scales:
+            yield from self.detect_scales(reduced_rows, self._analyze_column_list)
+            return
+
+        if self._batch:
+            yield from self.detect_series(reduced_rows, self._analyze_column_list)
+            return
+
+        yield from self.process(reduced_rows,
+                                self._analyze_column_list,
+                                sort_first=True)
                         
-            self.edge_detect_loop(reduced_rows, outf,
-                                  self._analyze_column_list,
-                                  sort_first=True)
-                            
@@ -19,11 +19,62 @@ with:
       of dictionary objects containing at least a 'function' and
       optional 'arguments', 'value', 'combine' and 'combine_arguments' entries.
 
+    - an optional 'maxLateness' integer field in the 'featureCounter:'
+      section.  When counting incrementally, this many timebins are
+      kept open behind the newest one seen so slightly out of order
+      rows are still counted in their own timebin; each timebin is
+      then emitted exactly once.  Rows arriving later than this are
+      dropped and counted in FeatureCounter.late_rows.
+
+    - an optional 'maxMemoryEntries' integer field in the
+      'featureCounter:' section.  When more than this many
+      index/key/subkey entries are being held in memory, the partial
+      results are spilled to sorted temporary files and merged back
+      together using the combine functions when the timebin is
+      emitted.
+
+    - Outputs may contain an optional 'sketch' dictionary (with
+      optional 'width', 'depth' and 'topK' entries) to approximately
+      count very large key spaces in a fixed amount of memory using a
+      Count-Min sketch.  Only the 'topK' largest key/subkey pairs in
+      each timebin are emitted, along with an error bound for each
+      of them in an index named INDEX_error.  The output's 'combine'
+      function is not used; values are always summed.
+
 """
 
+import collections
+import itertools
+import multiprocessing
+
 import gawseed.analysis
 from gawseed.algorithm.generic import one, identity, combine_summer
 from gawseed.support.functionLoader import load_function
+from gawseed.support.externalSort import write_run, merge_runs, external_sort
+from gawseed.countMinSketch import TopKSketch
+
+# the FeatureCounter instance used by parallel worker processes
+_worker_counter = None
+
+def _init_worker(counter):
+    global _worker_counter
+    _worker_counter = counter
+
+def _count_chunk(rows):
+    # always incremental, so the parent sees timebin changes in order
+    return list(_worker_counter.count_bins(rows, incremental=True))
+
+def _spill_sort_key(record):
+    # (index position, key, is-an-entry flag, subkey)
+    return record[:4]
+
+def _chunks(input_stream, chunk_size):
+    iterator = iter(input_stream)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
 
 class FeatureCounter(gawseed.analysis.Analysis):
     """Counts features found in data columns into key/subkey pairs.
@@ -32,10 +83,22 @@ class FeatureCounter(gawseed.analysis.Analysis):
        further information.
     """
     _mapping_functions = None
+    _plan = None
+    _filter_plan = None
 
-    def __init__(self, time_column, mapping_functions = None, bin_size = None, import_from_zip = None, yaml_specification = None, filter_functions = None):
+    def __init__(self, time_column, mapping_functions = None, bin_size = None, import_from_zip = None, yaml_specification = None, filter_functions = None, max_lateness = None, max_entries = None):
         super().__init__(time_column, bin_size, yaml_specification)
         self._import_from_zip = import_from_zip
+        self._late_rows = 0
+        self._spills = 0
+
+        self._max_lateness = max_lateness
+        if max_lateness is None and self._specification and 'featureCounter' in self._specification:
+            self._max_lateness = self._specification['featureCounter'].get('maxLateness')
+
+        self._max_entries = max_entries
+        if max_entries is None and self._specification and 'featureCounter' in self._specification:
+            self._max_entries = self._specification['featureCounter'].get('maxMemoryEntries')
 
         if mapping_functions is not None:
             self._mapping_functions = mapping_functions
@@ -88,6 +151,18 @@ class FeatureCounter(gawseed.analysis.Analysis):
             if 'value_arguments' not in self._mapping_functions[fn]:
                 self._mapping_functions[fn]['value_arguments'] = []
 
+            # fill in the sketch defaults if approximate counting was requested
+            if self._mapping_functions[fn].get('sketch') is not None:
+                sketch = self._mapping_functions[fn]['sketch']
+                if type(sketch) != dict:
+                    sketch = {}
+                sketch.setdefault('width', 2048)
+                sketch.setdefault('depth', 4)
+                sketch.setdefault('topK', 100)
+                self._mapping_functions[fn]['sketch'] = sketch
+            else:
+                self._mapping_functions[fn]['sketch'] = None
+
         # populate any missing arguments to filter functions
         for fn in self._filter_functions:
             print(fn)
@@ -102,10 +177,50 @@ class FeatureCounter(gawseed.analysis.Analysis):
             if 'arguments' not in fn:
                 fn['arguments'] = []
 
-    def process(self, input_stream, incremental=False):
-        prelim = {}
-        oldtimebin = -1
-
+    def compile_plan(self):
+        """Flattens the filter and mapping function specifications into
+           lists of pre-bound tuples so the per-row loop in process()
+           doesn't need to perform any specification lookups.  Must be
+           called after the column specifiers have been resolved."""
+        self._filter_plan = [(fn['function'], fn['arguments'])
+                             for fn in self._filter_functions]
+
+        self._plan = []
+        for index in self._mapping_functions:
+            spec = self._mapping_functions[index]
+            self._plan.append((index,
+                               spec['function'], spec['arguments'],
+                               spec['value'], spec['value_arguments'],
+                               spec['combine'], spec['sketch']))
+        return self._plan
+
+    def _new_bin(self, previous=None):
+        """Creates the results structure for a new timebin.  Sketches
+           from the previous structure are kept, if passed."""
+        results = {}
+        for (index, function, args, value_fn, value_args, combine_fn, sketch) in self._plan:
+            if not sketch:
+                results[index] = {}
+            elif previous:
+                results[index] = previous[index]
+            else:
+                results[index] = TopKSketch(sketch['width'], sketch['depth'],
+                                            sketch['topK'])
+        return results
+
+    def _sketch_rows(self, index, sketch):
+        """Generates the (index, key, subkey, value) rows for a sketch:
+           the top keys followed by their error bounds."""
+        top = sketch.top()
+        for ((key, subkey), estimate) in top:
+            yield (index, key, subkey, estimate)
+        error_bound = sketch.error_bound()
+        for ((key, subkey), estimate) in top:
+            yield (index + "_error", key, subkey, error_bound)
+
+    def prepare(self, input_stream):
+        """Resolves the filter argument specifiers against the input
+           stream and compiles the execution plan."""
         # now that we have input stream, process argument specifiers
         # XXX: this feels like the wrong place to do this
         for fn in self._filter_functions:
@@ -117,83 +232,349 @@ class FeatureCounter(gawseed.analysis.Analysis):
                     fn['arguments'][pos] = column
                 # else leave as is
 
+        return self.compile_plan()
+
+    def count_bins(self, input_stream, incremental=False):
+        """Counts the rows in input_stream, yielding (timebin, results,
+           row_count) tuples where results is a
+           {index: {key: {subkey: value}}} dictionary.  When
+           incremental is set, a timebin is yielded as soon as a row
+           from a different timebin is seen."""
+        prelim = {}
+        row_counts = {}
+        row_count = 0
+        oldtimebin = -1
+
+        # spilled partial results for each timebin
+        spills = {}
+        entries = 0
+        max_entries = self._max_entries or float('inf')
+
+        plan = self._plan
+        filter_plan = self._filter_plan
+        time_column = self._time_column
+        timebin_fn = self.timebin
+        current = None
+
         # loop through all the rows and evaluate each of them
         for row in input_stream:
 
             # apply any filters; if any return false then exclude the data
             skip=False
-            for fn in self._filter_functions:
-                if not fn['function'](row, fn['arguments']):
+            for (filter_fn, filter_args) in filter_plan:
+                if not filter_fn(row, filter_args):
                     skip = True
                     break
             if skip: # bad python style...  should use a function
                 continue
 
             # get the timestamp column value, and bin it
-            if self._time_column >= len(row)-1:
+            if time_column >= len(row)-1:
                 continue
-            timebin = self.timebin(row[self._time_column])
+            timebin = timebin_fn(row[time_column])
 
-            # create the slice for this timebin
-            if incremental and timebin != oldtimebin and oldtimebin != -1:
-                # start yielding values immediately after finishing a timestamp
-                for index in prelim[oldtimebin]:
-                    for key in prelim[oldtimebin][index]:
-                        for subkey in prelim[oldtimebin][index][key]:
-                            yield([oldtimebin, index, key, subkey,
-                                   prelim[oldtimebin][index][key][subkey]])
+            if timebin != oldtimebin:
+                if oldtimebin != -1:
+                    row_counts[oldtimebin] = row_counts.get(oldtimebin, 0) + row_count
+                    row_count = 0
 
-                # re-init the prelim data to drop the old data for mem savings
-                prelim = { }
+                # create the slice for this timebin
+                if incremental and oldtimebin != -1:
+                    # start yielding values immediately after finishing a timestamp
+                    yield (oldtimebin, self._finish_bin(oldtimebin, prelim[oldtimebin], spills),
+                           row_counts.pop(oldtimebin))
 
-            oldtimebin = timebin
+                    # re-init the prelim data to drop the old data for mem savings
+                    prelim = { }
+                    entries = 0
 
-            if timebin not in prelim:
+                if timebin not in prelim:
+                    # create a hash for each index too
+                    prelim[timebin] = self._new_bin()
 
-                prelim[timebin] = {}
-                
-                # create a hash for each index too
-                for name in self._mapping_functions:
-                    prelim[timebin][name] = {}
+                current = prelim[timebin]
+                oldtimebin = timebin
+
+            row_count += 1
 
             # for each mapping function, 
-            for index in self._mapping_functions:
-                args = self._mapping_functions[index]['arguments']
-                (key, subkey) = self._mapping_functions[index]['function'](row, args)
-            
+            for (index, function, args, value_fn, value_args, combine_fn, sketch) in plan:
+                (key, subkey) = function(row, args)
+
                 if not key:
                     continue
-                
+
+                if sketch:
+                    current[index].add((key, subkey), value_fn(row, value_args))
+                    continue
+
                 # this is faster than using a Counter from collections
-                if key not in prelim[timebin][index]:
-                    prelim[timebin][index][key] = {}
+                keys = current[index]
+                if key not in keys:
+                    subkeys = keys[key] = {}
+                else:
+                    subkeys = keys[key]
+
+                value = value_fn(row, value_args)
+
+                if subkey in subkeys:
+                    subkeys[subkey] = combine_fn(timebin, index, key, subkey,
+                                                 subkeys[subkey], value)
+                else:
+                    subkeys[subkey] = combine_fn(timebin, index, key, subkey,
+                                                 None, value)
+                    entries += 1
+
+            if entries > max_entries:
+                # too much data; write it all out to disk
+                for spilled_timebin in prelim:
+                    self.spill_bin(spilled_timebin, prelim[spilled_timebin], spills)
+                    prelim[spilled_timebin] = self._new_bin(prelim[spilled_timebin])
+                current = prelim[timebin]
+                entries = 0
+
+        if oldtimebin != -1:
+            row_counts[oldtimebin] = row_counts.get(oldtimebin, 0) + row_count
+
+        # collect and report all the results
+        for timebin in prelim:
+            yield (timebin, self._finish_bin(timebin, prelim[timebin], spills),
+                   row_counts[timebin])
+
+    def _spill_records(self, results, run_number):
+        """Generates the sortable records stored in spill files.  Each
+           key gets a header record noting where it was first seen, so
+           the original output ordering can be restored later."""
+        for (index_position, index) in enumerate(results):
+            if not isinstance(results[index], dict):
+                continue # sketches are never spilled
+            for (key_position, key) in enumerate(results[index]):
+                yield (index_position, key, 0, '', run_number, key_position)
+                subkeys = results[index][key]
+                for (subkey_position, subkey) in enumerate(subkeys):
+                    yield (index_position, key, 1, subkey,
+                           run_number, subkey_position, subkeys[subkey])
+
+    def spill_bin(self, timebin, results, spills):
+        """Writes the partial results for a timebin out to a sorted run
+           file, remembering it in the spills dictionary."""
+        runs = spills.setdefault(timebin, [])
+        records = sorted(self._spill_records(results, len(runs)),
+                         key=_spill_sort_key)
+        runs.append(write_run(records))
+        self._spills += 1
+
+    def _finish_bin(self, timebin, results, spills):
+        """Returns the results for a timebin, which will be an iterator
+           of merged (index, key, subkey, value) rows if any of its data
+           was spilled to disk."""
+        if timebin not in spills:
+            return results
+
+        runs = spills.pop(timebin)
+        runs.append(sorted(self._spill_records(results, len(runs)),
+                           key=_spill_sort_key))
+        return self._merge_spilled_bin(timebin, runs, results)
+
+    def _merge_spilled_bin(self, timebin, runs, results):
+        index_names = [step[0] for step in self._plan]
+        combiners = [step[5] for step in self._plan]
+
+        def merged_records():
+            # combine the values for each entry from each run, in order
+            header = None
+            pending = None
+            for record in merge_runs(runs, key=_spill_sort_key):
+                if record[2] == 0:
+                    # a key header; the earliest run holds the first sighting
+                    if record[:2] != header:
+                        header = record[:2]
+                        key_rank = (record[4], record[5])
+                    continue
 
-                
-                value_args = self._mapping_functions[index]['value_arguments']
-                value = self._mapping_functions[index]['value'](row, value_args)
+                if pending and record[:4] == pending_id:
+                    pending[5] = combiners[record[0]](timebin, index_names[record[0]],
+                                                      record[1], record[3],
+                                                      pending[5], record[6])
+                    continue
 
-                combine_fn = self._mapping_functions[index]['combine']
-                combine_args = self._mapping_functions[index]['combine_arguments']
-                current_val = None
+                if pending:
+                    yield pending
+                pending_id = record[:4]
+                # (index position, key rank, subkey rank, key, subkey, value)
+                pending = [record[0], key_rank, (record[4], record[5]),
+                           record[1], record[3], record[6]]
+
+            if pending:
+                yield pending
+
+        # restore the order in which the entries were first seen
+        ordered = external_sort(merged_records(),
+                                key=lambda record: record[:3],
+                                max_records=self._max_entries)
+        # sketches were held in memory, and go between the spilled indexes
+        next_position = 0
+        for record in ordered:
+            while next_position <= record[0]:
+                index = index_names[next_position]
+                if not isinstance(results[index], dict):
+                    yield from self._sketch_rows(index, results[index])
+                next_position += 1
+            yield (index_names[record[0]], record[3], record[4], record[5])
+
+        for index in index_names[next_position:]:
+            if not isinstance(results[index], dict):
+                yield from self._sketch_rows(index, results[index])
+
+    def merge_bin(self, timebin, results, partial):
+        """Merges the partial {index: {key: {subkey: value}}} results
+           for a timebin into results using each output's combine
+           function."""
+        for index in partial:
+            if not isinstance(partial[index], dict):
+                results[index].merge(partial[index])
+                continue
 
-                if subkey in prelim[timebin][index][key]:
-                    current_val = prelim[timebin][index][key][subkey]
+            combine_fn = self._mapping_functions[index]['combine']
+            keys = results[index]
+            for key in partial[index]:
+                if key not in keys:
+                    keys[key] = partial[index][key]
+                    continue
+                subkeys = keys[key]
+                for (subkey, value) in partial[index][key].items():
+                    if subkey in subkeys:
+                        subkeys[subkey] = combine_fn(timebin, index, key, subkey,
+                                                     subkeys[subkey], value)
+                    else:
+                        subkeys[subkey] = value
+        return results
+
+    def parallel_count_bins(self, input_stream, incremental=False,
+                            workers=2, chunk_size=10000):
+        """Identical to count_bins(), but splits the rows into chunks
+           that are counted by a pool of worker processes.  The
+           partial results are merged back together in input order,
+           so the output is the same as the single process version.
+           At most 2 * workers chunks are in flight at any time."""
+        prelim = {}
+        row_counts = {}
+        oldtimebin = None
+        pending = collections.deque()
+
+        pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                    initargs=(self,))
+        try:
+            chunks = _chunks(input_stream, chunk_size)
+            while True:
+                for chunk in itertools.islice(chunks, 2 * workers - len(pending)):
+                    pending.append(pool.apply_async(_count_chunk, (chunk,)))
+                if not pending:
+                    break
 
-                prelim[timebin][index][key][subkey] = combine_fn(timebin, index,
-                                                                 key, subkey,
-                                                                 current_val, value)
-                    
-            oldtimebin = timebin
+                # each chunk returns its timebins in the order seen
+                for (timebin, partial, rows) in pending.popleft().get():
+                    if timebin != oldtimebin:
+                        if incremental and oldtimebin is not None:
+                            yield (oldtimebin, prelim[oldtimebin],
+                                   row_counts.pop(oldtimebin))
+                            prelim = {}
+                        oldtimebin = timebin
+
+                    if timebin not in prelim:
+                        prelim[timebin] = partial
+                        row_counts[timebin] = rows
+                    else:
+                        self.merge_bin(timebin, prelim[timebin], partial)
+                        row_counts[timebin] += rows
+        finally:
+            pool.terminate()
 
-        # collect and report all the results
         for timebin in prelim:
-            for index in prelim[timebin]:
-                for key in prelim[timebin][index]:
-                    for subkey in prelim[timebin][index][key]:
+            yield (timebin, prelim[timebin], row_counts[timebin])
+
+    def watermark_bins(self, bins, max_lateness):
+        """Takes a stream of (timebin, results, row_count) tuples from
+           an incremental count and keeps up to max_lateness older
+           timebins open behind the newest one seen, merging any
+           slightly out of order data into them.  Timebins are only
+           yielded (in time order) once they fall behind this
+           watermark, so each is emitted exactly once.  Data for
+           timebins that were already emitted is dropped and counted
+           in late_rows."""
+        open_bins = {}
+        row_counts = {}
+        watermark = None
+        allowed = max_lateness * self._bin_size
+
+        for (timebin, partial, rows) in bins:
+            if watermark is not None and timebin < watermark:
+                self._late_rows += rows
+                continue
+
+            if timebin not in open_bins:
+                open_bins[timebin] = partial
+                row_counts[timebin] = rows
+            else:
+                self.merge_bin(timebin, open_bins[timebin], partial)
+                row_counts[timebin] += rows
+
+            if watermark is None or timebin - allowed > watermark:
+                watermark = timebin - allowed
+                for old in sorted(open_bins):
+                    if old >= watermark:
+                        break
+                    yield (old, open_bins.pop(old), row_counts.pop(old))
+
+        for timebin in sorted(open_bins):
+            yield (timebin, open_bins[timebin], row_counts[timebin])
+
+    def process(self, input_stream, incremental=False, workers=None,
+                chunk_size=10000):
+        if self._max_entries and ((workers and workers > 1) or
+                                  (incremental and self._max_lateness is not None)):
+            raise ValueError("maxMemoryEntries can not be combined with multiple workers or maxLateness")
+
+        self.prepare(input_stream)
+
+        if workers and workers > 1:
+            bins = self.parallel_count_bins(input_stream, incremental,
+                                            workers, chunk_size)
+        else:
+            bins = self.count_bins(input_stream, incremental)
+
+        if incremental and self._max_lateness is not None:
+            bins = self.watermark_bins(bins, self._max_lateness)
+
+        for (timebin, results, row_count) in bins:
+            if not isinstance(results, dict):
+                # merged from data spilled to disk
+                for (index, key, subkey, value) in results:
+                    yield([timebin, index, key, subkey, value])
+                continue
+
+            for index in results:
+                if not isinstance(results[index], dict):
+                    for (name, key, subkey, value) in self._sketch_rows(index, results[index]):
+                        yield([timebin, name, key, subkey, value])
+                    continue
+
+                for key in results[index]:
+                    for subkey in results[index][key]:
                         yield([timebin, index, key, subkey,
-                               prelim[timebin][index][key][subkey]])
+                               results[index][key][subkey]])
 
-    
     def mapping_functions(self):
         return self._mapping_functions
 
+    @property
+    def late_rows(self):
+        """The number of rows dropped for arriving after their timebin
+           was already emitted (see maxLateness)."""
+        return self._late_rows
+
+    @property
+    def spills(self):
+        """The number of times partial results were spilled to disk."""
+        return self._spills
+
@@ -1,20 +1,122 @@
 #!/usr/bin/python3
 
+import collections
+import multiprocessing
+
 import gawseed.analysis
 from gawseed.algorithm.generic import one, identity
 from gawseed.support.functionLoader import load_function
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_worker_analysis = None
+
+def _init_worker(analysis):
+    global _worker_analysis
+    _worker_analysis = analysis
+
+def _process_bundle(bundle):
+    return list(_worker_analysis.process_bundle(bundle))
+
+class BinPivot(object):
+    """Pivots a timebin's bundle into arrays with one entry per
+       (key, subkey) cell, in the same order that the cells are
+       visited by RelationshipAnalysis.process(), for use by
+       vectorized column functions.  Arrays for each index are
+       created on first use and then cached."""
+
+    def __init__(self, bundle):
+        self.bundle = bundle
+        self.cells = []
+        self._slots = []
+        for (key, subkeys) in bundle['data'].items():
+            for (subkey, slot) in subkeys.items():
+                self.cells.append((key, subkey))
+                self._slots.append(slot)
+        self._raw = {}
+        self._values = {}
+        self._key_rows = {}
+
+    def __len__(self):
+        return len(self.cells)
+
+    def raw(self, index):
+        "An object array of each cell's value for index (or None)."
+        if index not in self._raw:
+            raw = numpy.empty(len(self._slots), dtype=object)
+            raw[:] = [slot.get(index) for slot in self._slots]
+            self._raw[index] = raw
+        return self._raw[index]
+
+    def values(self, index):
+        """A float array of each cell's value for index, which is NaN
+           for cells without a (numeric) value."""
+        if index not in self._values:
+            values = numpy.full(len(self._slots), numpy.nan)
+            for (row, value) in enumerate(self.raw(index)):
+                if value is not None:
+                    try:
+                        values[row] = float(value)
+                    except (TypeError, ValueError):
+                        pass
+            self._values[index] = values
+        return self._values[index]
+
+    def present(self, index):
+        "A boolean array of the cells that have a value for index."
+        return numpy.not_equal(self.raw(index), None)
+
+    def key_rows(self, subkey=''):
+        """An integer array giving the row of the (key, subkey) cell
+           for each cell's key, or -1 when there is no such cell."""
+        if subkey not in self._key_rows:
+            rows = {}
+            for (row, (key, cell_subkey)) in enumerate(self.cells):
+                if cell_subkey == subkey:
+                    rows[key] = row
+            self._key_rows[subkey] = numpy.array([rows.get(key, -1) for (key, cell_subkey) in self.cells],
+                                                 dtype=numpy.int64)
+        return self._key_rows[subkey]
+
+    def lookup_values(self, index, subkey=''):
+        """A float array of the index value from each cell's (key,
+           subkey) cell, or NaN when it doesn't exist."""
+        rows = self.key_rows(subkey)
+        values = numpy.append(self.values(index), numpy.nan)
+        return values[rows]  # -1 selects the NaN appended above
+
 class RelationshipAnalysis(gawseed.analysis.Analysis):
     """Performs final math analysis and transforms row data into columns.
 
        See the scripts/general/relationshipAnalysis.py documentation for
        further information.
+
+       When vectorized is True (or 'vectorized: true' is set in the
+       relationshipAnalysis YAML section), each timebin is pivoted
+       into NumPy arrays (see BinPivot) and output functions with a
+       'vectorized' attribute are calculated for the whole timebin
+       at once.  Other functions are still called once per cell.
+       This requires numpy to be installed.
+
+       Passing workers to process() calculates multiple timebins at
+       once in a pool of worker processes.  Output functions that
+       remember data between timebins (those with a true 'stateful'
+       attribute, like value_max) can not be used with workers.
     """
-    def __init__(self, output_columns=None, import_from_zip=None, yaml_specification=None):
+    def __init__(self, output_columns=None, import_from_zip=None, yaml_specification=None, vectorized=None):
         super().__init__(None, None, yaml_specification = yaml_specification)
         self._output_columns = output_columns
         self._import_from_zip = import_from_zip
 
+        if vectorized is None and self._specification and 'relationshipAnalysis' in self._specification:
+            vectorized = self._specification['relationshipAnalysis'].get('vectorized')
+        self._vectorized = bool(vectorized)
+        if self._vectorized and numpy is None:
+            raise ValueError("vectorized relationshipAnalysis requires numpy to be installed")
+
         if not output_columns:
             if yaml_specification == None:
                 raise ValueError("RelationshipAnalysis requires either output_columns or yaml_specification to be passed")
@@ -64,25 +166,89 @@ class RelationshipAnalysis(gawseed.analysis.Analysis):
         yield { 'time_index': current_index,
                 'data': current_data }
 
-    def process(self, data_iterator):
+    def process_vectorized(self, bundle):
+        "Calculates the output rows for a bundle, a column at a time."
+        pivot = BinPivot(bundle)
+        data = bundle['data']
+        columns = []
+        for column in self._output_columns:
+            column_def = self._output_columns[column]
+            function = column_def['function']
+            if hasattr(function, 'vectorized'):
+                columns.append(function.vectorized(pivot, column_def['arguments']))
+            else:
+                columns.append([function(bundle, key, subkey, data[key][subkey], column_def['arguments'])
+                                for (key, subkey) in pivot.cells])
+
+        timeindex = bundle['time_index']
+        for ((key, subkey), calculated) in zip(pivot.cells, zip(*columns)):
+            for value in calculated:
+                if value is not None:
+                    yield [timeindex, key, subkey] + list(calculated)
+                    break
+
+    def process_bundle(self, bundle):
+        "Calculates the output rows for a single timebin's bundle."
+        # each bundle gets a fresh memo cache shared by the functions
+        # for its timebin (see gawseed.algorithm.relationship.bundle_cache)
+        bundle['cache'] = {}
+
+        if self._vectorized:
+            yield from self.process_vectorized(bundle)
+            return
+
+        # bundle will be {time_index: foo, data: { key: { subkey: { index: VAL }}}} structures
+        timeindex = bundle['time_index']
+        data = bundle['data']
+        for key in data:
+            for subkey in data[key]:
+                result_row = [timeindex, key, subkey]
+                have_data = False
+                for column in self._output_columns:
+                    column_def = self._output_columns[column]
+                    calculated = column_def['function'](bundle, key, subkey, data[key][subkey],
+                                                        column_def['arguments'])
+                    if calculated is not None:
+                        have_data = True
+                    result_row.append(calculated)
+
+                if have_data:
+                    yield result_row
+
+    def parallel_process(self, data_iterator, workers=2):
+        """Identical to process(), but ships each timebin's bundle to a
+           pool of worker processes.  Rows are still returned in time
+           order, and at most 2 * workers bundles are in flight at any
+           time."""
+        for column in self._output_columns:
+            function = self._output_columns[column]['function']
+            if getattr(function, 'stateful', False):
+                raise ValueError("output column '%s' keeps state between timebins and can not be used with multiple workers" % (column))
+
+        pending = collections.deque()
+        pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                    initargs=(self,))
+        try:
+            bundles = self.collect_data(data_iterator)
+            while True:
+                for bundle in bundles:
+                    pending.append(pool.apply_async(_process_bundle, (bundle,)))
+                    if len(pending) >= 2 * workers:
+                        break
+                if not pending:
+                    break
+
+                yield from pending.popleft().get()
+        finally:
+            pool.terminate()
+
+    def process(self, data_iterator, workers=None):
+        if workers and workers > 1:
+            yield from self.parallel_process(data_iterator, workers)
+            return
+
         for bundle in self.collect_data(data_iterator):
-            # bundle will be {time_index: foo, data: { key: { subkey: { index: VAL }}}} structures
-            timeindex = bundle['time_index']
-            data = bundle['data']
-            for key in data:
-                for subkey in data[key]:
-                    result_row = [timeindex, key, subkey]
-                    have_data = False
-                    for column in self._output_columns:
-                        column_def = self._output_columns[column]
-                        calculated = column_def['function'](bundle, key, subkey, data[key][subkey],
-                                                            column_def['arguments'])
-                        if calculated is not None:
-                            have_data = True
-                        result_row.append(calculated)
-
-                    if have_data:
-                        yield result_row
+            yield from self.process_bundle(bundle)
 
     def column_names(self):
         return list(self._output_columns.keys())
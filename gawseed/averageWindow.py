@@ -4,9 +4,18 @@
 
 Classes:
     - AverageWindow
+    - AverageWindowBank
+
+Functions:
+    - window_totals
 
 """
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 class AverageWindow(object):
     """Handles the creation of a sliding window with the ability 
     to quickly average each half as elements are added.
@@ -121,6 +130,26 @@ class AverageWindow(object):
         if self.index >= self._window_size:
             self.index = 0
 
+    def add_zeros(self, count):
+        """Add count 0.0 elements.  When every stored element would be
+        replaced the window is simply cleared instead, so a long run
+        of zeros costs no more than the window size."""
+        if count >= self._window_size * 2 + self._middle_size:
+            self.clear()
+            return
+        for num in range(0, count):
+            self.add_element(0.0)
+
+    def clear(self):
+        "Reset the window to all zeros."
+        self.lhs_data = [0.0] * self._window_size
+        self.rhs_data = [0.0] * self._window_size
+        self.middle_data = [0.0] * self._middle_size
+        self.lhs = 0.0
+        self.rhs = 0.0
+        self.middle = 0
+        self.index = 0
+
     def get_lhs(self):
         "Get the left hand averaged window value."
         return self.lhs
@@ -152,6 +181,201 @@ class AverageWindow(object):
         print("rhs:  " + str(self.get_rhs()))
         print("dlta: " + str(self.get_delta()))
 
+class AverageWindowBank(object):
+    """Stores many AverageWindows of the same sizes together, one per
+    row of 2-D (rows x window_size) ring buffer arrays, so that
+    elements can be added to every window in a single vectorized
+    operation.  The running lhs and rhs totals of every row are kept
+    in the lhs and rhs arrays, and are calculated with the same
+    operations in the same order as AverageWindow, so they give
+    identical results.
+
+    Usage:
+
+      bank = AverageWindowBank(window_size = 4)
+      first = bank.add_row()
+      second = bank.add_row()
+      bank.add_elements([first, second], [1.0, 9.0])
+      deltas = bank.rhs[:bank.rows] - bank.lhs[:bank.rows]
+
+    The rows passed to add_elements() in a single call must be unique.
+    This requires numpy to be installed.
+
+"""
+
+    def __init__(self, window_size = 5, middle_size = 0, capacity = 1024):
+        if numpy is None:
+            raise ValueError("AverageWindowBank requires numpy to be installed")
+
+        self._window_size = window_size
+        self._middle_size = middle_size
+        self._rows = 0
+        self._capacity = 0
+        self.lhs_data = numpy.zeros((0, window_size))
+        self.rhs_data = numpy.zeros((0, window_size))
+        self.middle_data = numpy.zeros((0, middle_size))
+        self.lhs = numpy.zeros(0)
+        self.rhs = numpy.zeros(0)
+        self.index = numpy.zeros(0, dtype=numpy.int64)
+        self.middle = numpy.zeros(0, dtype=numpy.int64)
+        self._grow(max(capacity, 1))
+
+    @property
+    def window_size(self):
+        return self._window_size
+
+    @property
+    def middle_size(self):
+        return self._middle_size
+
+    @property
+    def rows(self):
+        "The number of rows (windows) in use."
+        return self._rows
+
+    def _grow(self, capacity):
+        def grown(array):
+            new_array = numpy.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            new_array[:self._rows] = array[:self._rows]
+            return new_array
+
+        self.lhs_data = grown(self.lhs_data)
+        self.rhs_data = grown(self.rhs_data)
+        self.middle_data = grown(self.middle_data)
+        self.lhs = grown(self.lhs)
+        self.rhs = grown(self.rhs)
+        self.index = grown(self.index)
+        self.middle = grown(self.middle)
+        self._capacity = capacity
+
+    def add_row(self):
+        "Adds a new (zero filled) window, returning its row number."
+        if self._rows >= self._capacity:
+            self._grow(self._capacity * 2)
+        self._rows += 1
+        return self._rows - 1
+
+    def all_rows(self):
+        "Returns an array of every row number in use."
+        return numpy.arange(self._rows)
+
+    def add_elements(self, rows, new_elements):
+        """Add an element to the current slot of each (unique) row,
+           just like AverageWindow.add_element()."""
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+        new_elements = numpy.asarray(new_elements, dtype=float)
+        index = self.index[rows]
+
+        # update the total counts
+        if self._middle_size > 0:
+            middle = self.middle[rows]
+            moving = self.middle_data[rows, middle]
+            self.lhs[rows] = self.lhs[rows] - self.lhs_data[rows, index] + moving
+            self.lhs_data[rows, index] = moving
+            self.middle_data[rows, middle] = self.rhs_data[rows, index]
+
+            # update the middle index
+            middle += 1
+            middle[middle >= self._middle_size] = 0
+            self.middle[rows] = middle
+        else:
+            moving = self.rhs_data[rows, index]
+            self.lhs[rows] = self.lhs[rows] - self.lhs_data[rows, index] + moving
+            self.lhs_data[rows, index] = moving
+
+        # rhs side updating is always the same regardless of middle
+        self.rhs[rows] = self.rhs[rows] - self.rhs_data[rows, index] + new_elements
+        self.rhs_data[rows, index] = new_elements
+
+        # handle lhs and rhs index cycling
+        index += 1
+        index[index >= self._window_size] = 0
+        self.index[rows] = index
+
+    def add_zeros(self, rows, counts):
+        """Add counts (an array, or a single count for every row) 0.0
+           elements to each of the (unique) rows, just like
+           AverageWindow.add_zeros()."""
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+        counts = numpy.broadcast_to(numpy.asarray(counts, dtype=numpy.int64), rows.shape)
+
+        full = counts >= self._window_size * 2 + self._middle_size
+        if full.any():
+            self.clear(rows[full])
+
+        partial = ~full & (counts > 0)
+        rows = rows[partial]
+        counts = counts[partial]
+        for num in range(0, int(counts.max()) if len(counts) else 0):
+            adding = rows[counts > num]
+            self.add_elements(adding, numpy.zeros(len(adding)))
+
+    def clear(self, rows):
+        "Reset the windows of rows to all zeros."
+        self.lhs_data[rows] = 0.0
+        self.rhs_data[rows] = 0.0
+        self.middle_data[rows] = 0.0
+        self.lhs[rows] = 0.0
+        self.rhs[rows] = 0.0
+        self.index[rows] = 0
+        self.middle[rows] = 0
+
+    def get_lhs(self, row):
+        "Get the left hand averaged window value of a row."
+        return self.lhs[row].item()
+
+    def get_rhs(self, row):
+        "Get the right hand averaged window value of a row."
+        return self.rhs[row].item()
+
+    def get_delta(self, row):
+        "Get the delta between a row's windows: right minus the left."
+        return (self.rhs[row] - self.lhs[row]).item()
+
+    def get_data(self, row):
+        "Get an array containing all the data stored for a row."
+        return self.lhs_data[row].tolist() + self.middle_data[row].tolist() + \
+            self.rhs_data[row].tolist()
+
+def window_totals(elements, window_size = 5, middle_size = 0):
+    """Returns arrays of the lhs and rhs totals a new AverageWindow
+    would have after each of the elements was added to it, calculated
+    all at once from cumulative sums.
+
+    Rather than summing each window's contents, the value leaving and
+    the value entering each window are subtracted and added in the
+    same order as add_element() does, so the totals are identical:
+
+      lhs, rhs = window_totals([1, 1, 9, 9], window_size = 2)
+      # rhs[3] == AverageWindow.get_rhs() after adding all 4 elements
+
+    This requires numpy to be installed.
+    """
+    if numpy is None:
+        raise ValueError("window_totals requires numpy to be installed")
+
+    elements = numpy.asarray(elements, dtype=float)
+    count = len(elements)
+    total_size = window_size * 2 + middle_size
+
+    # padded[n + total_size] is the n-th element, preceded by the zeros
+    # a new window starts with
+    padded = numpy.concatenate([numpy.zeros(total_size), elements])
+
+    def running_totals(leaving, entering):
+        changes = numpy.empty(count * 2)
+        changes[0::2] = -leaving
+        changes[1::2] = entering
+        return numpy.cumsum(changes)[1::2]
+
+    lhs_start = total_size - window_size - middle_size
+    rhs_start = total_size - window_size
+    lhs = running_totals(padded[:count],
+                         padded[lhs_start:lhs_start + count])
+    rhs = running_totals(padded[rhs_start:rhs_start + count],
+                         padded[total_size:])
+    return (lhs, rhs)
+
 if __name__ == "__main__":
     pass
     
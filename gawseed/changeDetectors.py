@@ -0,0 +1,158 @@
+#!/usr/bin/python
+
+"""contains change detectors with the same interface as AverageWindow
+
+Classes:
+    - EWMAWindow
+    - CUSUMWindow
+
+"""
+
+class EWMAWindow(object):
+    """Compares a fast and a slow exponentially weighted moving
+    average of a time series, rather than the totals of two windows of
+    stored elements as AverageWindow does.  Only two floats are kept,
+    no matter how large the window is.
+
+    The fast average weights each new element by 1 / window_size and
+    the slow one by 1 / (window_size * 2 + middle_size), so they
+    roughly follow the same spans of time as an AverageWindow's rhs
+    and whole window.  Like AverageWindow's totals, both averages are
+    returned multiplied by window_size:
+
+      ewma = EWMAWindow(window_size = 4)
+      for n in range(0, 20):
+        ewma.add_element(1)
+      ewma.add_element(9)
+
+      lhs = ewma.get_lhs() # the slow average (* 4)
+      rhs = ewma.get_rhs() # the fast average (* 4)
+      delta = ewma.get_delta() # == rhs-lhs
+
+"""
+
+    # one of these is kept for every key, so skip the per-instance dict
+    __slots__ = ('_window_size', '_middle_size', '_fast_weight',
+                 '_slow_weight', 'fast', 'slow')
+
+    def __init__(self, window_size = 5, middle_size = 0):
+        self._window_size = window_size
+        self._middle_size = middle_size
+        self._fast_weight = 1.0 / window_size
+        self._slow_weight = 1.0 / (window_size * 2 + middle_size)
+        self.fast = 0.0
+        self.slow = 0.0
+
+    @property
+    def window_size(self):
+        return self._window_size
+
+    @property
+    def middle_size(self):
+        return self._middle_size
+
+    def add_element(self, new_element):
+        "Add an element to both moving averages."
+        self.fast += self._fast_weight * (new_element - self.fast)
+        self.slow += self._slow_weight * (new_element - self.slow)
+
+    def add_zeros(self, count):
+        "Add count 0.0 elements, which simply decays both averages."
+        self.fast *= (1.0 - self._fast_weight) ** count
+        self.slow *= (1.0 - self._slow_weight) ** count
+
+    def clear(self):
+        "Reset both averages to zero."
+        self.fast = 0.0
+        self.slow = 0.0
+
+    def get_lhs(self):
+        "Get the slow (baseline) average, scaled to a window total."
+        return self.slow * self._window_size
+
+    def get_rhs(self):
+        "Get the fast (recent) average, scaled to a window total."
+        return self.fast * self._window_size
+
+    def get_delta(self):
+        "Get the delta between the averages: right minus the left."
+        return self.get_rhs() - self.get_lhs()
+
+
+class CUSUMWindow(object):
+    """Detects changes with a pair of one sided cumulative sums
+    (CUSUM) of how far each element is above or below a slowly moving
+    baseline, keeping just three floats no matter how large the window
+    is.
+
+    The baseline is a moving average weighting each new element by
+    1 / (window_size * 2 + middle_size).  Each sum leaks 1 /
+    window_size of itself per element (so it settles back to zero
+    once the series does), and deviations smaller than drift are
+    ignored.  The lhs is the baseline scaled to a window total, and
+    the rhs is the lhs plus the difference of the sums, so a lasting
+    step of N per element eventually gives an rhs about N *
+    window_size above the lhs, just like an AverageWindow:
+
+      cusum = CUSUMWindow(window_size = 4, drift = 0.5)
+      for n in range(0, 20):
+        cusum.add_element(1)
+      cusum.add_element(9)
+
+      delta = cusum.get_delta() # == rhs-lhs
+
+"""
+
+    __slots__ = ('_window_size', '_middle_size', '_drift',
+                 '_baseline_weight', '_leak', 'baseline', 'upper', 'lower')
+
+    def __init__(self, window_size = 5, middle_size = 0, drift = 0.0):
+        self._window_size = window_size
+        self._middle_size = middle_size
+        self._drift = drift
+        self._baseline_weight = 1.0 / (window_size * 2 + middle_size)
+        self._leak = 1.0 - 1.0 / window_size
+        self.baseline = 0.0
+        self.upper = 0.0
+        self.lower = 0.0
+
+    @property
+    def window_size(self):
+        return self._window_size
+
+    @property
+    def middle_size(self):
+        return self._middle_size
+
+    def add_element(self, new_element):
+        "Add an element to the sums, then move the baseline toward it."
+        deviation = new_element - self.baseline
+        self.upper = max(0.0, self.upper * self._leak + deviation - self._drift)
+        self.lower = max(0.0, self.lower * self._leak - deviation - self._drift)
+        self.baseline += self._baseline_weight * deviation
+
+    def add_zeros(self, count):
+        "Add count 0.0 elements."
+        for num in range(0, count):
+            self.add_element(0.0)
+
+    def clear(self):
+        "Reset the baseline and sums to zero."
+        self.baseline = 0.0
+        self.upper = 0.0
+        self.lower = 0.0
+
+    def get_lhs(self):
+        "Get the baseline, scaled to a window total."
+        return self.baseline * self._window_size
+
+    def get_rhs(self):
+        "Get the baseline plus the cumulative deviation from it."
+        return self.get_lhs() + self.upper - self.lower
+
+    def get_delta(self):
+        "Get the cumulative deviation: right minus the left."
+        return self.get_rhs() - self.get_lhs()
+
+if __name__ == "__main__":
+    pass
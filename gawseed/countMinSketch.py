@@ -0,0 +1,158 @@
+#!/usr/bin/python
+
+"""contains classes for approximately counting very large key spaces
+
+Classes:
+    - CountMinSketch
+    - TopKSketch
+
+"""
+
+import hashlib
+import math
+
+class CountMinSketch(object):
+    """A Count-Min sketch, which approximately sums values for an
+    unbounded number of items in a fixed (width x depth) table.
+
+    Each item is hashed to one counter in each of the depth rows, and
+    its estimate is the smallest of those counters.  Estimates never
+    undercount, and overcount by at most e/width * total with a
+    probability of 1 - e^-depth.
+
+    Usage:
+
+      cms = CountMinSketch(width = 2048, depth = 4)
+      cms.add("www.example.com", 1)
+      count = cms.estimate("www.example.com")
+
+    Items are hashed with a stable (non-randomized) hash, so sketches
+    created with the same width and depth in different processes can
+    be merged together.
+    """
+
+    def __init__(self, width = 2048, depth = 4):
+        self._width = int(width)
+        self._depth = int(depth)
+        self._total = 0
+        self.table = []
+        for row in range(0, self._depth):
+            self.table.append([0] * self._width)
+
+    @property
+    def width(self):
+        return self._width
+
+    @property
+    def depth(self):
+        return self._depth
+
+    @property
+    def total(self):
+        "The sum of all the values added to the sketch."
+        return self._total
+
+    def positions(self, item):
+        "Returns the counter position of an item in each row."
+        digest = hashlib.blake2b(str(item).encode('utf-8', 'surrogateescape'),
+                                 digest_size = 4 * self._depth).digest()
+        return [int.from_bytes(digest[4 * row:4 * row + 4], 'little') % self._width
+                for row in range(0, self._depth)]
+
+    def add(self, item, value = 1):
+        "Adds value to the item's count, returning the new estimate."
+        self._total += value
+        estimate = None
+        for (row, position) in zip(self.table, self.positions(item)):
+            row[position] += value
+            if estimate is None or row[position] < estimate:
+                estimate = row[position]
+        return estimate
+
+    def estimate(self, item):
+        "Returns the (over)estimated count for an item."
+        return min([row[position] for (row, position)
+                    in zip(self.table, self.positions(item))])
+
+    def error_bound(self):
+        "The maximum expected overcount for any single item."
+        return math.e / self._width * self._total
+
+    def merge(self, other):
+        "Adds the counts from another sketch of the same dimensions."
+        if other.width != self._width or other.depth != self._depth:
+            raise ValueError("only sketches with the same width and depth can be merged")
+        for (row, other_row) in zip(self.table, other.table):
+            for position in range(0, self._width):
+                row[position] += other_row[position]
+        self._total += other.total
+
+
+class TopKSketch(object):
+    """Tracks the (approximately) top_k largest items added to a
+    CountMinSketch, in the style of a Space-Saving counter: an item
+    not currently tracked replaces the smallest tracked item once its
+    estimated count grows larger.
+
+    Usage:
+
+      topk = TopKSketch(width = 2048, depth = 4, top_k = 10)
+      for name in names:
+          topk.add(name, 1)
+      for (name, estimate) in topk.top():
+          ...
+
+    """
+
+    def __init__(self, width = 2048, depth = 4, top_k = 100):
+        self._top_k = int(top_k)
+        self.sketch = CountMinSketch(width, depth)
+        self.counts = {}
+        self._smallest = None
+
+    @property
+    def top_k(self):
+        return self._top_k
+
+    def add(self, item, value = 1):
+        "Adds value to an item's count."
+        estimate = self.sketch.add(item, value)
+        counts = self.counts
+
+        if item in counts:
+            counts[item] = estimate
+            if item == self._smallest:
+                self._smallest = None
+        elif len(counts) < self._top_k:
+            counts[item] = estimate
+            self._smallest = None
+        else:
+            if self._smallest is None:
+                self._smallest = min(counts, key=counts.get)
+            if estimate > counts[self._smallest]:
+                del counts[self._smallest]
+                counts[item] = estimate
+                self._smallest = None
+
+    def top(self):
+        "Returns a list of (item, estimate) tuples, largest first."
+        return sorted(self.counts.items(), key=lambda item: item[1],
+                      reverse=True)
+
+    def error_bound(self):
+        "The maximum expected overcount for any single item."
+        return self.sketch.error_bound()
+
+    def merge(self, other):
+        """Merges another TopKSketch (of the same dimensions) into this
+           one, re-estimating every candidate item afterward."""
+        self.sketch.merge(other.sketch)
+        candidates = list(self.counts) + [item for item in other.counts
+                                          if item not in self.counts]
+        estimates = [(item, self.sketch.estimate(item)) for item in candidates]
+        estimates.sort(key=lambda item: item[1], reverse=True)
+        self.counts = dict(estimates[:self._top_k])
+        self._smallest = None
+
+if __name__ == "__main__":
+    pass
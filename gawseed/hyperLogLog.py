@@ -0,0 +1,134 @@
+#!/usr/bin/python
+
+"""contains the HyperLogLog class for estimating unique counts
+
+Classes:
+    - HyperLogLog
+
+"""
+
+import base64
+import hashlib
+import math
+import zlib
+
+class HyperLogLog(object):
+    """Estimates the number of distinct items added to it using a
+    fixed number (2^precision) of small registers, no matter how many
+    items are seen.  The standard error of the estimate is roughly
+    1.04 / sqrt(2^precision) (about 1.6% for the default precision of
+    12, using 4KB of registers).
+
+    Usage:
+
+      hll = HyperLogLog(precision = 12)
+      for name in names:
+          hll.add(name)
+      count = hll.cardinality()
+
+    Registers can be serialized to a compact string and merged with
+    registers from other HyperLogLogs of the same precision, so
+    distributed counts can be combined without the original items:
+
+      hll.merge(HyperLogLog.deserialize(other_hll.serialize()))
+
+    Items are hashed with a stable (non-randomized) hash so registers
+    from different processes can be merged together.
+    """
+
+    PREFIX = "hll:"
+
+    def __init__(self, precision = 12):
+        precision = int(precision)
+        if precision < 4 or precision > 18:
+            raise ValueError("HyperLogLog precision must be between 4 and 18")
+
+        self._precision = precision
+        self._size = 1 << precision
+        self.registers = bytearray(self._size)
+
+        # running totals so the estimate can be calculated quickly
+        self._inverse_sum = float(self._size)
+        self._zeros = self._size
+
+        if self._size >= 128:
+            self._alpha = 0.7213 / (1.0 + 1.079 / self._size)
+        elif self._size >= 64:
+            self._alpha = 0.709
+        elif self._size >= 32:
+            self._alpha = 0.697
+        else:
+            self._alpha = 0.673
+
+    @property
+    def precision(self):
+        return self._precision
+
+    def add(self, item):
+        "Adds an item to the set being counted."
+        hashed = int.from_bytes(hashlib.blake2b(str(item).encode('utf-8', 'surrogateescape'),
+                                                digest_size = 8).digest(), 'little')
+        remaining_bits = 64 - self._precision
+        register = hashed >> remaining_bits
+        remainder = hashed & ((1 << remaining_bits) - 1)
+        rank = remaining_bits - remainder.bit_length() + 1
+
+        old_rank = self.registers[register]
+        if rank > old_rank:
+            self.registers[register] = rank
+            self._inverse_sum += 2.0 ** -rank - 2.0 ** -old_rank
+            if old_rank == 0:
+                self._zeros -= 1
+
+    def cardinality(self):
+        "Returns the estimated number of distinct items added."
+        estimate = self._alpha * self._size * self._size / self._inverse_sum
+        if estimate <= 2.5 * self._size and self._zeros > 0:
+            # use linear counting for small sets
+            estimate = self._size * math.log(float(self._size) / self._zeros)
+        return estimate
+
+    def _recalculate(self):
+        self._inverse_sum = 0.0
+        self._zeros = 0
+        for rank in self.registers:
+            self._inverse_sum += 2.0 ** -rank
+            if rank == 0:
+                self._zeros += 1
+
+    def merge(self, other):
+        "Merges the registers from another HyperLogLog into this one."
+        if other.precision != self._precision:
+            raise ValueError("only HyperLogLogs with the same precision can be merged")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        self._recalculate()
+
+    def serialize(self):
+        "Returns the registers encoded as a compact string."
+        return "%s%d:%s" % (self.PREFIX, self._precision,
+                            base64.b64encode(zlib.compress(bytes(self.registers))).decode('ascii'))
+
+    @classmethod
+    def deserialize(cls, serialized):
+        "Creates a HyperLogLog from a string created by serialize()"
+        if not cls.is_serialized(serialized):
+            raise ValueError("not a serialized HyperLogLog")
+        (precision, encoded) = serialized[len(cls.PREFIX):].split(":", 1)
+        hll = cls(int(precision))
+        registers = zlib.decompress(base64.b64decode(encoded))
+        if len(registers) != hll._size:
+            raise ValueError("serialized HyperLogLog has the wrong number of registers")
+        hll.registers = bytearray(registers)
+        hll._recalculate()
+        return hll
+
+    @classmethod
+    def is_serialized(cls, value):
+        "Returns True if value looks like a string created by serialize()"
+        return isinstance(value, str) and value.startswith(cls.PREFIX)
+
+    def __str__(self):
+        return self.serialize()
+
+if __name__ == "__main__":
+    pass
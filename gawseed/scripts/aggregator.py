@@ -4,24 +4,48 @@
 
 USAGE
 
-aggregator.py [-t time_column] [-a aggregator] 
-              [-s aggregate_specification] [-u unsorted_keys]
+aggregator.py [-t time_column] [-s aggregate_specification]
               [input_file] [output_file]
 
+aggregator.py -a generic [-k sorted_keys] -u unsorted_keys
+              -V value_columns [-U] [-M max_memory_rows]
+              [input_file] [output_file]
+
+aggregator.py [options] -o output_file -m shard_file [shard_file ...]
+
+aggregator.py [-L max_lateness] [input_file] [output_file]
+
 The script aggregates all the incoming data for a given set of keys.
 By default we assume that this is the output of the FeatureCounter
 from the gawseed modules and the aggregator algorithm is set to
-gawseed.analysis.aggregator.FastAggregator.  Use the -a, -s and -u
-switches to change that algorithm and parameters to the
+gawseed.analysis.aggregator.FastAggregator.  Use the -a, -k, -u and
+-V switches to change that algorithm and parameters to the
 gawseed.analysis.aggregator.Aggregator if another type of input data
-is used.
-
-XXX: gawseed.analysis.aggregator.Aggregator is incomplete
+is used: the -V value columns are summed for each unique combination
+of the -u columns within each unique combination of the -k columns
+(which default to the time column).  The input must be sorted by the
+-k columns unless -U is given, in which case it is sorted first.
+Either way at most -M rows or unique keys are held in memory at a
+time, with the rest spilled to temporary files.
+
+Multiple input files that are each already sorted by time (eg, the
+featureCounter outputs from multiple hosts) can be given with -m,
+which merges them together on the time column as they are read
+rather than requiring them to be concatenated and sorted first.
+
+Input is normally required to be sorted by time.  Use -L to hold
+that many timebins open behind the newest one, so rows that arrive
+slightly out of order are still aggregated.  Rows later than this are
+dropped, and the number dropped is reported on stderr.
 
 EXAMPLE
 
 featureCounter.py [args] | aggregrator.py > results
 
+aggregator.py -o results -m host1-counts host2-counts host3-counts
+
+aggregator.py -a generic -U -k day -u srcip -V bytes packets < flows
+
 """
 
 import argparse
@@ -36,6 +60,8 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '../..', 'modules'))
 # place holders for objects to load later
 Fsdb = None
 FastAggregator = None
+Aggregator = None
+merge_sorted_inputs = None
 
 def parse_args():
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -43,6 +69,25 @@ def parse_args():
     parser.add_argument("-t", "--time-column", default="timestamp", type=str,
                         help="The name of the time column to use")
 
+    parser.add_argument("-a", "--aggregator", default="fast", type=str,
+                        choices=["fast", "generic"],
+                        help="The aggregator to use: fast for featureCounter output, or generic for other tables")
+
+    parser.add_argument("-k", "--sorted-keys", nargs="*", type=str,
+                        help="Columns the input is sorted by, for the generic aggregator (default: the time column)")
+
+    parser.add_argument("-u", "--unsorted-keys", nargs="*", default=[], type=str,
+                        help="Columns to group rows by within the sorted keys, for the generic aggregator")
+
+    parser.add_argument("-V", "--value-columns", nargs="*", default=[], type=str,
+                        help="Columns to sum, for the generic aggregator")
+
+    parser.add_argument("-U", "--unsorted-input", action="store_true",
+                        help="The input is not sorted by the sorted keys, so sort it first (generic aggregator only)")
+
+    parser.add_argument("-M", "--max-memory-rows", default=1000000, type=int,
+                        help="The maximum number of rows or unique keys to hold in memory before spilling to temporary files (generic aggregator only)")
+
     parser.add_argument("-s", "--specification", nargs="*", default=["gawseed.analysis.aggregator.summer"],
                         help="Specification to specify special aggregator operations")
 
@@ -52,6 +97,15 @@ def parse_args():
     parser.add_argument("-Z", "--use-zip", nargs="*", type=str,
                         help="Use zipimporter to load modules this zip file rather than the native imports")
 
+    parser.add_argument("-L", "--max-lateness", default=None, type=int,
+                        help="Number of timebins to hold open for late arriving rows")
+
+    parser.add_argument("-m", "--merge-files", nargs="+", type=argparse.FileType('r'),
+                        help="Multiple time-sorted input files to merge together, rather than reading input_file")
+
+    parser.add_argument("-o", "--output", type=argparse.FileType('w'),
+                        help="File to write, instead of output_file (useful with -m)")
+
     parser.add_argument("input_file", type=argparse.FileType('r'),
                         nargs='?', default=sys.stdin,
                         help="File to read")
@@ -61,11 +115,16 @@ def parse_args():
                         help="File to read")
 
     args = parser.parse_args()
+
+    if args.output:
+        args.output_file = args.output
     return args
 
 def load_modules(args):
     global Fsdb
     global FastAggregator
+    global Aggregator
+    global merge_sorted_inputs
     if args.use_zip:
         import zipimport
         importer = zipimport.zipimporter(args.use_zip[0])
@@ -75,25 +134,58 @@ def load_modules(args):
 
         Fsdb = fsdb_module.Fsdb
         FastAggregator = aggregator_module.FastAggregator
+        Aggregator = aggregator_module.Aggregator
+        merge_sorted_inputs = aggregator_module.merge_sorted_inputs
     else:
         from pyfsdb import Fsdb
-        from gawseed.analysis.aggregator import FastAggregator
+        from gawseed.analysis.aggregator import FastAggregator, Aggregator, merge_sorted_inputs
 
 def main():
     args = parse_args()
     load_modules(args)
 
-    f = Fsdb(file_handle = args.input_file, out_file_handle = args.output_file, pass_comments='e')
-
-    time_col_num = f.get_column_number(args.time_column)
-
-    # create the feature counter instance
-    ag = FastAggregator(aggregators = args.specification,
-                        yaml_specification = args.yaml_specification)
+    if args.merge_files:
+        inputs = [Fsdb(file_handle = merge_file, pass_comments='e')
+                  for merge_file in args.merge_files]
+        columns = inputs[0].column_names
+        for other in inputs[1:]:
+            if other.column_names != columns:
+                raise ValueError("all merged input files must have the same columns")
+
+        f = Fsdb(out_file_handle = args.output_file, pass_comments='e')
+        f.out_column_names = columns
+        time_col_num = inputs[0].get_column_number(args.time_column)
+        data = merge_sorted_inputs(inputs, time_col_num)
+    else:
+        f = Fsdb(file_handle = args.input_file, out_file_handle = args.output_file, pass_comments='e')
+        data = f
+
+    if args.aggregator == "generic":
+        source = inputs[0] if args.merge_files else f
+        sorted_keys = args.sorted_keys
+        if sorted_keys is None:
+            sorted_keys = [args.time_column]
+        if not args.value_columns:
+            raise ValueError("the generic aggregator requires at least one -V value column")
+
+        ag = Aggregator(sorted_fields = source.get_column_numbers(sorted_keys),
+                        non_sorted_fields = source.get_column_numbers(args.unsorted_keys),
+                        value_columns = source.get_column_numbers(args.value_columns),
+                        sorted_input = not args.unsorted_input,
+                        max_memory_rows = args.max_memory_rows)
+        f.out_column_names = sorted_keys + args.unsorted_keys + args.value_columns
+    else:
+        # create the feature counter instance
+        ag = FastAggregator(aggregators = args.specification,
+                            yaml_specification = args.yaml_specification,
+                            max_lateness = args.max_lateness)
 
-    for output_row in ag.process(f):
+    for output_row in ag.process(data):
         f.append(output_row)
 
+    if args.aggregator == "fast" and ag.late_rows:
+        sys.stderr.write("aggregator: dropped %d rows that arrived too late\n" % (ag.late_rows))
+
 if __name__ == "__main__":
     main()
 
@@ -5,6 +5,7 @@
 USAGE
 
 featureCounter.py [-t time_column] [-b bin_size] -s SPEC \
+                  [-w workers] [-L max_lateness] [-M max_memory_entries]
                   [input_file] [output_file]
 
 Where SPEC is a comma separated list of colon separated data to
@@ -26,6 +27,20 @@ The output will consist of five columns:
     subkey:  the second output from the ALGORITHM results
     value:   the count of the key/subkey's for that index in that timebin 
 
+Use -w to split the input rows across multiple worker processes; the
+partial counts from each worker are merged back together using each
+output's combine function, producing the same output as a single
+process.
+
+Use -L to keep that many timebins open behind the newest one seen, so
+slightly out of order input is still counted in the right timebin and
+each timebin is output only once.  Rows later than this are dropped
+(and a count of them is reported on stderr).
+
+Use -M to limit the number of index/key/subkey entries held in memory;
+beyond this, partial counts are spilled to temporary files (in $TMPDIR)
+and merged back together when each timebin is output.
+
 EXAMPLE
 
 Count all the individual 'name' columns seen in a dataset:
@@ -77,6 +92,18 @@ def parse_args():
     parser.add_argument("-y", "--yaml-specification", type=argparse.FileType('r'),
                         help="YAML file to use for loading processing specifications")
 
+    parser.add_argument("-w", "--workers", default=1, type=int,
+                        help="Number of worker processes to count rows with")
+
+    parser.add_argument("-C", "--chunk-size", default=10000, type=int,
+                        help="Number of rows to send to a worker process at a time")
+
+    parser.add_argument("-L", "--max-lateness", default=None, type=int,
+                        help="Number of timebins to hold open for late arriving rows")
+
+    parser.add_argument("-M", "--max-memory-entries", default=None, type=int,
+                        help="Number of key/subkey entries to hold in memory before spilling to disk")
+
     parser.add_argument("-Z", "--use-zip", nargs="*", type=str,
                         help="Use zipimporter to load modules this zip file rather than the native imports")
 
@@ -156,7 +183,9 @@ def main():
 
     # create the feature counter instance
     fc = FeatureCounter(time_col_num, mapping_functions, bin_size = bin_size,
-                        yaml_specification = args.yaml_specification)
+                        yaml_specification = args.yaml_specification,
+                        max_lateness = args.max_lateness,
+                        max_entries = args.max_memory_entries)
 
     # XXX: don't assume all arguments are column names
     mapping_functions = fc.mapping_functions()
@@ -173,9 +202,14 @@ def main():
     # declare the output names for fsdb
     f.out_column_names = ['timestamp','index','key','subkey','value']
 
-    for output_row in fc.process(f, incremental = True):
+    for output_row in fc.process(f, incremental = True,
+                                 workers = args.workers,
+                                 chunk_size = args.chunk_size):
         f.append(output_row)
 
+    if fc.late_rows:
+        sys.stderr.write("featureCounter: dropped %d rows that arrived too late\n" % (fc.late_rows))
+
 if __name__ == "__main__":
     main()
 
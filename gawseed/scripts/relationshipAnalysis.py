@@ -5,11 +5,18 @@
 USAGE
 
 relationshipAnalysis.py [-t time_column] -c output_column_defs
-              [input_file] [output_file]
+              [-V] [-w workers] [input_file] [output_file]
 
 The script performs mathematical functions to analyze relationship in
 data between multiple columns in gawseed aggregated output format.
 
+Use -V to calculate each timebin's columns with NumPy arrays rather
+than one cell at a time, which is much faster for large timebins.
+
+Use -w to process multiple timebins at once in a pool of worker
+processes (eg, for backfills over long periods).  Output is still
+written in time order.
+
 EXAMPLE
 
 featureCounter.py -y analysis.yml | aggregrator.py -y analysis.yml |
@@ -41,6 +48,12 @@ def parse_args():
     parser.add_argument("-y", "--yaml-specification", type=argparse.FileType('r'),
                         help="YAML file to use for loading processing specifications")
 
+    parser.add_argument("-V", "--vectorized", action="store_true",
+                        help="Calculate output columns for each timebin at once using numpy")
+
+    parser.add_argument("-w", "--workers", default=None, type=int,
+                        help="Number of worker processes to analyze timebins with")
+
     parser.add_argument("-Z", "--use-zip", nargs="*", type=str,
                         help="Use zipimporter to load modules this zip file rather than the native imports")
 
@@ -103,7 +116,8 @@ def main():
 
     # create the relationship analysis instance
     ra = RelationshipAnalysis(args.columns_info, import_from_zip=args.use_zip,
-                              yaml_specification = args.yaml_specification)
+                              yaml_specification = args.yaml_specification,
+                              vectorized = args.vectorized or None)
 
     f = Fsdb(file_handle = args.input_file, out_file_handle = args.output_file, pass_comments='e')
 
@@ -116,7 +130,7 @@ def main():
     #print("#" + str(f.column_names))
     
 
-    for output_row in ra.process(f):
+    for output_row in ra.process(f, workers=args.workers):
         f.append(output_row)
 
 if __name__ == "__main__":
@@ -0,0 +1,74 @@
+"""Sorting and merging of record streams that may be too large to
+hold in memory at once.
+
+Records are spilled to temporary "run" files in sorted order, and the
+runs are later merged back together with a heap-based merge.  Records
+can be any picklable object.
+"""
+
+import heapq
+import pickle
+import tempfile
+
+# the number of records pickled together in a single run file entry
+BATCH_SIZE = 1000
+
+def write_run(records, directory=None):
+    """Writes an (already sorted) iterable of records to a temporary
+       run file, returning the file object.  The file is deleted once
+       closed."""
+    run = tempfile.TemporaryFile(dir=directory)
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= BATCH_SIZE:
+            pickle.dump(batch, run, pickle.HIGHEST_PROTOCOL)
+            batch = []
+    if batch:
+        pickle.dump(batch, run, pickle.HIGHEST_PROTOCOL)
+    run.seek(0)
+    return run
+
+def read_run(run):
+    """Reads all the records back from a run file, closing (and thus
+       deleting) it once done.  In-memory lists are passed through."""
+    if not hasattr(run, 'read'):
+        yield from run
+        return
+
+    try:
+        while True:
+            try:
+                batch = pickle.load(run)
+            except EOFError:
+                break
+            yield from batch
+    finally:
+        run.close()
+
+def merge_runs(runs, key=None):
+    """Merges a list of sorted runs (run files or sorted lists) into a
+       single sorted stream.  Records that compare equal are returned
+       in the order of the runs they came from."""
+    return heapq.merge(*[read_run(run) for run in runs], key=key)
+
+def external_sort(records, key=None, max_records=1000000, directory=None):
+    """Sorts an iterable of records, keeping at most max_records of
+       them in memory at a time.  Larger inputs are spilled to sorted
+       run files which are merged together while iterating over the
+       results.  The sort is stable."""
+    runs = []
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= max_records:
+            chunk.sort(key=key)
+            runs.append(write_run(chunk, directory))
+            chunk = []
+
+    chunk.sort(key=key)
+    if not runs:
+        return iter(chunk)
+
+    runs.append(chunk)
+    return merge_runs(runs, key)
@@ -76,6 +76,73 @@ class aggregatorTests(unittest.TestCase):
                                                       ['60', '30', 'i', 'k2', 's', 't', 10.0, 1.0],
                                                       ['120', '30', 'i', 'k', 's', 't', 100.0, 10.0]])
                                   
+    def test_aggregate_unsorted_data(self):
+        from gawseed.analysis.aggregator import Aggregator
+
+        data = [['120', 'i', 'k', 's', '100'],
+                ['60', 'i', 'k', 's', '32'],
+                ['9', 'j', 'k', 's', '1'],
+                ['60', 'i', 'k2', 's', '10'],
+                ['120', 'i', 'k', 's', '1'],
+                ['60', 'i', 'k', 's', '10']]
+
+        # spill the sort to disk every two rows
+        ag = Aggregator(sorted_input = False, max_memory_rows = 2)
+        self._do_aggregator_tests(ag, "slow-unsorted", data = data,
+                                  expected_results = [['9', 'j', 'k', 's', 1.0],
+                                                      ['60', 'i', 'k', 's', 42.0],
+                                                      ['60', 'i', 'k2', 's', 10.0],
+                                                      ['120', 'i', 'k', 's', 101.0]])
+
+        # group without any sorted fields
+        ag = Aggregator(sorted_fields = [], non_sorted_fields = [2])
+        self._do_aggregator_tests(ag, "slow-ungrouped", data = data,
+                                  expected_results = [['k', 144.0],
+                                                      ['k2', 10.0]])
+
+    def test_aggregate_spilled_groups(self):
+        from gawseed.analysis.aggregator import Aggregator
+
+        data = [['60', 'i', 'k3', 's', '1'],
+                ['60', 'i', 'k', 's', '32'],
+                ['60', 'i', 'k2', 's', '10'],
+                ['60', 'i', 'k3', 's', '2'],
+                ['60', 'i', 'k', 's', '10'],
+                ['120', 'i', 'k', 's', '100']]
+        expected_results = [['60', 'i', 'k', 's', 42.0],
+                            ['60', 'i', 'k2', 's', 10.0],
+                            ['60', 'i', 'k3', 's', 3.0],
+                            ['120', 'i', 'k', 's', 100.0]]
+
+        # a group's table is spilled every time it holds two keys
+        for sorted_input in [True, False]:
+            ag = Aggregator(sorted_input = sorted_input, max_memory_rows = 2)
+            self._do_aggregator_tests(ag, "slow-spilled", data = data,
+                                      expected_results = expected_results)
+
+        # non-finite keys are merged like any other string key
+        nan_data = [['60', 'i', 'nan', 's', '1'],
+                    ['60', 'i', '5', 's', '2'],
+                    ['60', 'i', 'nan', 's', '4'],
+                    ['60', 'i', '1', 's', '8'],
+                    ['60', 'i', 'inf', 's', '16'],
+                    ['60', 'i', 'nan', 's', '32'],
+                    ['60', 'i', '5', 's', '64']]
+        for sorted_input in [True, False]:
+            ag = Aggregator(sorted_input = sorted_input, max_memory_rows = 1)
+            self._do_aggregator_tests(ag, "slow-spilled-nan", data = nan_data,
+                                      expected_results = [['60', 'i', '1', 's', 8.0],
+                                                          ['60', 'i', '5', 's', 66.0],
+                                                          ['60', 'i', 'inf', 's', 16.0],
+                                                          ['60', 'i', 'nan', 's', 37.0]])
+
+        # and a single group of every row
+        ag = Aggregator(sorted_fields = [], non_sorted_fields = [2], max_memory_rows = 1)
+        self._do_aggregator_tests(ag, "slow-spilled-ungrouped", data = data,
+                                  expected_results = [['k', 142.0],
+                                                      ['k2', 10.0],
+                                                      ['k3', 3.0]])
+
     def test_aggregate_unique_counts(self):
         from gawseed.analysis.aggregator import FastAggregator
         from gawseed.algorithm.aggregator import sumAndCountUnique
@@ -232,6 +299,44 @@ aggregator:
 #        import pdb ; pdb.set_trace()
         self._do_aggregator_tests(FastAggregator(yaml_specification = yaml_specification), "fast-unique", data = data, expected_results = expected_results)
 
+    def test_aggregate_unique_resets_each_bin(self):
+        from gawseed.analysis.aggregator import FastAggregator
+
+        yaml_specification = """
+aggregator:
+  aggregators:
+    - function: gawseed.algorithm.aggregator.unique
+      arguments: ['i', 'un']
+    - function: gawseed.algorithm.aggregator.hll_unique
+      arguments: ['i', 'hll']
+
+"""
+        ag = FastAggregator(yaml_specification = yaml_specification)
+        self._do_aggregator_tests(ag, "fast-unique-bins",
+                                  data = [['60', 'i', 'k', 's', '32'],
+                                          ['60', 'i', 'k', 's2', '10'],
+                                          ['120', 'i', 'k', 's', '10'],
+                                          ['180', 'i', 'k', 's', '10'],
+                                          ['180', 'i', 'k', 's2', '10'],
+                                  ],
+                                  expected_results = [['60', 'un', 'k', 'un', 2],
+                                                      ['60', 'hll', 'k', 'hll', 2],
+                                                      ['120', 'un', 'k', 'un', 1],
+                                                      ['120', 'hll', 'k', 'hll', 1],
+                                                      ['180', 'un', 'k', 'un', 2],
+                                                      ['180', 'hll', 'k', 'hll', 2],
+                                  ])
+
+        # the per-timebin storage lives in (and goes away with) the results
+        self.assertEqual([aggregator['arguments'] for aggregator in ag._aggregators],
+                         [['i', 'un'], ['i', 'hll']],
+                         "the aggregator arguments aren't changed")
+
+        from gawseed.algorithm.aggregator import unique, BIN_STORAGE
+        results = {}
+        unique('i', 'k', 's', 1.0, results, ['i', 'un'])
+        self.assertEqual(results[BIN_STORAGE], { ('unique', 'un'): { 'k': set(['s']) } })
+
     def test_aggregate_string_splitter(self):
         from gawseed.analysis.aggregator import FastAggregator
         from gawseed.algorithm.aggregator import stringSplitter
@@ -291,6 +396,173 @@ aggregator:
                                   ])
 
 
+    def test_aggregate_hll_unique(self):
+        from gawseed.analysis.aggregator import FastAggregator
+
+        yaml_specification = """
+aggregator:
+  aggregators:
+    - function: gawseed.algorithm.aggregator.summer
+      arguments: []
+    - function: gawseed.algorithm.aggregator.hll_unique
+      arguments: ['i2', 'un', 10]
+
+"""
+
+        self._do_aggregator_tests(FastAggregator(yaml_specification = yaml_specification), "fast-hll-unique",
+                                  data = [['60', 'i', 'k', 's', '32'],
+                                          ['60', 'i2', 'k', 's', '10'],
+                                          ['60', 'i2', 'k', 's2', '10'],
+                                          ['60', 'i2', 'k', 's', '10'],
+                                  ],
+                                  expected_results = [['60', 'i', 'k', 's', 32.0],
+                                                      ['60', 'i2', 'k', 's', 20.0],
+                                                      ['60', 'i2', 'k', 's2', 10.0],
+                                                      ['60', 'un', 'k', 'un', 2],
+                                  ])
+
+    def test_aggregate_hll_unique_from_shards(self):
+        from gawseed.analysis.aggregator import FastAggregator
+        from gawseed.analysis.featureCounter import FeatureCounter
+
+        # two featureCounter shards each see some of the same names
+        shards = [
+            [[0, 'www.example.com'], [0, 'mail.example.com'], [0, 'www.example.org']],
+            [[1, 'www.example.com'], [1, 'ftp.example.com']],
+        ]
+
+        rows = []
+        for shard in shards:
+            fc = FeatureCounter(0, { 'names': { 'function': 'gawseed.algorithm.dns.PSL_domain',
+                                                'arguments': [1],
+                                                'value': 'column_value',
+                                                'value_arguments': [1],
+                                                'combine': 'combine_hll' } })
+            for row in fc.process(input_stream = [row + ['extra'] for row in shard]):
+                rows.append([str(column) for column in row])
+
+        yaml_specification = """
+aggregator:
+  aggregators:
+    - function: gawseed.algorithm.aggregator.hll_unique
+      arguments: ['names', 'unique_names']
+
+"""
+
+        self._do_aggregator_tests(FastAggregator(yaml_specification = yaml_specification), "fast-hll-shards",
+                                  data = rows,
+                                  expected_results = [['0', 'unique_names', 'example.com', 'unique_names', 3],
+                                                      ['0', 'unique_names', 'example.org', 'unique_names', 1],
+                                  ])
+
+        # anything else that isn't a number is still an error
+        for store in ['nested', 'flat']:
+            with self.assertRaises(ValueError):
+                list(FastAggregator(store = store).process([['0', 'i', 'k', 's', 'bogus']]))
+
+    def test_fast_aggregate_flat_store(self):
+        from gawseed.analysis.aggregator import FastAggregator
+
+        self._do_aggregator_tests(FastAggregator(store = 'flat'), "fast-flat")
+
+        yaml_specification = """
+aggregator:
+  store: flat
+  aggregators:
+    - function: gawseed.algorithm.aggregator.summer
+      arguments: []
+    - function: gawseed.algorithm.aggregator.unique
+      arguments: ['i', 'un']
+
+"""
+
+        self._do_aggregator_tests(FastAggregator(yaml_specification = yaml_specification), "fast-flat-unique",
+                                  data = [['60', 'i', 'k', 's', '32'],
+                                          ['60', 'i', 'k', 's2', '10'],
+                                          ['60', 'i', 'k', 's', '10'],
+                                          ['120', 'i', 'k', 's', '100'],
+                                  ],
+                                  expected_results = [['60', 'i', 'k', 's', 42.0],
+                                                      ['60', 'un', 'k', 'un', 2],
+                                                      ['60', 'i', 'k', 's2', 10.0],
+                                                      ['120', 'i', 'k', 's', 100.0],
+                                                      ['120', 'un', 'k', 'un', 1],
+                                  ])
+
+    def test_fast_aggregate_flat_store_errors(self):
+        from gawseed.analysis.aggregator import FastAggregator
+
+        with self.assertRaises(ValueError):
+            FastAggregator(store = 'sideways')
+
+        def no_flat(index, key, subkey, value, results, args = []):
+            pass
+
+        with self.assertRaises(ValueError):
+            FastAggregator(aggregators = [no_flat], store = 'flat')
+
+    def test_fast_aggregate_merged_inputs(self):
+        from gawseed.analysis.aggregator import FastAggregator, merge_sorted_inputs
+
+        shards = [[['60', 'i', 'k', 's', '32'],
+                   ['120', 'i', 'k', 's', '100']],
+                  [['60', 'i', 'k2', 's', '10'],
+                   ['60', 'i', 'k', 's', '10']],
+                  []]
+
+        self._do_aggregator_tests(FastAggregator(), "fast-merged",
+                                  data = merge_sorted_inputs(shards))
+
+        with self.assertRaises(ValueError):
+            list(merge_sorted_inputs([[['120', 'i', 'k', 's', '1'],
+                                       ['60', 'i', 'k', 's', '1']]]))
+
+    def test_fast_aggregate_max_lateness(self):
+        from gawseed.analysis.aggregator import FastAggregator
+
+        data = [['60', 'i', 'k', 's', '32'],
+                ['120', 'i', 'k', 's', '100'],
+                ['60', 'i', 'k2', 's', '10'],
+                ['180', 'i', 'k', 's', '1'],
+                ['60', 'i', 'k', 's', '10'],
+                ['120', 'i', 'k', 's', '5']]
+
+        with self.assertRaises(ValueError):
+            list(FastAggregator().process(data))
+
+        ag = FastAggregator(max_lateness = 1)
+        self._do_aggregator_tests(ag, "fast-lateness", data = data,
+                                  expected_results = [['60', 'i', 'k', 's', 32.0],
+                                                      ['60', 'i', 'k2', 's', 10.0],
+                                                      ['120', 'i', 'k', 's', 105.0],
+                                                      ['180', 'i', 'k', 's', 1.0]])
+        self.assertEqual(ag.late_rows, 1, "one row arrived after its timebin was emitted")
+
+        ag = FastAggregator(max_lateness = 0)
+        self._do_aggregator_tests(ag, "fast-lateness-zero",
+                                  data = [['120', 'i', 'k', 's', '1'],
+                                          ['60', 'i', 'k', 's', '1'],
+                                          ['180', 'i', 'k', 's', '1']],
+                                  expected_results = [['120', 'i', 'k', 's', 1.0],
+                                                      ['180', 'i', 'k', 's', 1.0]])
+        self.assertEqual(ag.late_rows, 1, "a row older than the window is late")
+
+        yaml_specification = """
+aggregator:
+  maxLateness: 2
+  aggregators:
+    - function: gawseed.algorithm.aggregator.summer
+      arguments: []
+
+"""
+        ag = FastAggregator(yaml_specification = yaml_specification)
+        self._do_aggregator_tests(ag, "fast-lateness-yaml", data = data,
+                                  expected_results = [['60', 'i', 'k', 's', 42.0],
+                                                      ['60', 'i', 'k2', 's', 10.0],
+                                                      ['120', 'i', 'k', 's', 105.0],
+                                                      ['180', 'i', 'k', 's', 1.0]])
+        self.assertEqual(ag.late_rows, 0, "no rows were late")
+
     def test_load_function(self):
         from gawseed.analysis.aggregator import FastAggregator
 
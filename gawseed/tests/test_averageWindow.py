@@ -62,3 +62,67 @@ class averageWindowTests(unittest.TestCase):
         self.assertEqual(aw.get_delta(), 20+40 - (1+5),
                          "delta is 20+40 - (1+5)")
         
+
+    def test_bank(self):
+        from gawseed.averageWindow import AverageWindow, AverageWindowBank
+
+        bank = AverageWindowBank(window_size=2, middle_size=1, capacity=1)
+        windows = []
+        for row in range(0, 3):
+            self.assertEqual(bank.add_row(), row, "rows are numbered in order")
+            windows.append(AverageWindow(window_size=2, middle_size=1))
+
+        elements = [[-1, 1, 5, 0, 20, 40],
+                    [0.1, 0.2, 0.3, 0.4, 0.5, 0.6],
+                    [9, 9, 9, 1, 1, 1]]
+        for step in range(0, 6):
+            bank.add_elements([0, 1, 2], [row[step] for row in elements])
+            for row in range(0, 3):
+                windows[row].add_element(elements[row][step])
+
+        # the last row skips a step
+        bank.add_elements([0, 1], [3, 4])
+        windows[0].add_element(3)
+        windows[1].add_element(4)
+
+        for row in range(0, 3):
+            self.assertEqual(bank.get_lhs(row), windows[row].get_lhs(), "LHS matches")
+            self.assertEqual(bank.get_rhs(row), windows[row].get_rhs(), "RHS matches")
+            self.assertEqual(bank.get_data(row), windows[row].get_data(), "data matches")
+
+    def test_add_zeros(self):
+        from gawseed.averageWindow import AverageWindow, AverageWindowBank
+
+        for count in [1, 3, 5, 20]:
+            aw = AverageWindow(window_size=2, middle_size=1)
+            zeros = AverageWindow(window_size=2, middle_size=1)
+            bank = AverageWindowBank(window_size=2, middle_size=1)
+            bank.add_row()
+            for element in [3, 1, 4, 1, 5, 9]:
+                aw.add_element(element)
+                zeros.add_element(element)
+                bank.add_elements([0], [element])
+
+            aw.add_zeros(count)
+            bank.add_zeros([0], [count])
+            for num in range(0, count):
+                zeros.add_element(0.0)
+
+            self.assertEqual(aw.get_lhs(), zeros.get_lhs(), "LHS matches")
+            self.assertEqual(aw.get_rhs(), zeros.get_rhs(), "RHS matches")
+            self.assertEqual(sorted(aw.get_data()), sorted(zeros.get_data()), "data matches")
+            self.assertEqual(bank.get_lhs(0), aw.get_lhs(), "bank LHS matches")
+            self.assertEqual(bank.get_rhs(0), aw.get_rhs(), "bank RHS matches")
+
+    def test_window_totals(self):
+        from gawseed.averageWindow import AverageWindow, window_totals
+
+        elements = [0.1, 0.2, 0.7, 13.3, 0, 1e9, 0.3, 0, 0, 2.5, 0.1, 0.1]
+        for (window_size, middle_size) in [(1, 0), (2, 1), (3, 0), (2, 3)]:
+            (lhs, rhs) = window_totals(elements, window_size, middle_size)
+            aw = AverageWindow(window_size, middle_size)
+            for (number, element) in enumerate(elements):
+                aw.add_element(element)
+                # exactly equal, including any rounding
+                self.assertEqual(lhs[number], aw.get_lhs(), "LHS matches")
+                self.assertEqual(rhs[number], aw.get_rhs(), "RHS matches")
@@ -0,0 +1,47 @@
+import unittest
+
+class changeDetectorTests(unittest.TestCase):
+    def _step(self, detector, before=20, after=40):
+        "Adds a step from 1 up to 9, returning the deltas afterward."
+        for n in range(0, before):
+            detector.add_element(1)
+        deltas = []
+        for n in range(0, after):
+            detector.add_element(9)
+            deltas.append(detector.get_delta())
+        return deltas
+
+    def test_ewma(self):
+        from gawseed.changeDetectors import EWMAWindow
+        ewma = EWMAWindow(window_size=4, middle_size=1)
+
+        deltas = self._step(ewma)
+        self.assertGreater(deltas[2], 8, "the fast average rises first")
+        self.assertLess(deltas[-1], 1, "the slow average catches up")
+        self.assertAlmostEqual(ewma.get_rhs(), 36, 0, "averages are scaled to totals")
+        self.assertEqual(ewma.get_delta(), ewma.get_rhs() - ewma.get_lhs())
+
+        fast = ewma.fast
+        ewma.add_zeros(3)
+        self.assertAlmostEqual(ewma.fast, fast * 0.75 ** 3, msg="zeros decay the averages")
+        ewma.clear()
+        self.assertEqual((ewma.get_lhs(), ewma.get_rhs()), (0.0, 0.0))
+
+    def test_cusum(self):
+        from gawseed.changeDetectors import CUSUMWindow
+        cusum = CUSUMWindow(window_size=4, middle_size=1, drift=0.5)
+
+        deltas = self._step(cusum)
+        self.assertGreater(deltas[2], 12, "the upper sum grows")
+        self.assertLess(deltas[-1], 1, "and leaks away once the baseline catches up")
+
+        for n in range(0, 5):
+            cusum.add_element(0)
+        self.assertLess(cusum.get_delta(), -16, "the lower sum grows on a drop")
+
+        cusum.clear()
+        self.assertEqual((cusum.get_lhs(), cusum.get_rhs()), (0.0, 0.0))
+        self.assertFalse(hasattr(cusum, '__dict__'), "keys only cost their slots")
+
+if __name__ == '__main__':
+    unittest.main()
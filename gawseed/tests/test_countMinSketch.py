@@ -0,0 +1,47 @@
+import unittest
+
+class countMinSketchTests(unittest.TestCase):
+    def test_estimates(self):
+        from gawseed.countMinSketch import CountMinSketch
+        cms = CountMinSketch(width=100, depth=4)
+
+        for n in range(0, 10):
+            cms.add("common")
+        cms.add("rare", 2)
+
+        self.assertTrue(cms.estimate("common") >= 10, "never undercounts")
+        self.assertTrue(cms.estimate("rare") >= 2, "never undercounts")
+        self.assertEqual(cms.total, 12, "total is the sum of all values")
+
+    def test_merge(self):
+        from gawseed.countMinSketch import CountMinSketch
+        left = CountMinSketch(width=100, depth=4)
+        right = CountMinSketch(width=100, depth=4)
+
+        left.add("item", 3)
+        right.add("item", 4)
+        left.merge(right)
+
+        self.assertEqual(left.estimate("item"), 7, "merged counts are summed")
+
+        with self.assertRaises(ValueError):
+            left.merge(CountMinSketch(width=10, depth=4))
+
+    def test_top_k(self):
+        from gawseed.countMinSketch import TopKSketch
+        topk = TopKSketch(width=1000, depth=4, top_k=2)
+
+        for (item, count) in [("a", 5), ("b", 1), ("c", 3), ("d", 2)]:
+            for n in range(0, count):
+                topk.add(item)
+
+        self.assertEqual(topk.top(), [("a", 5), ("c", 3)],
+                         "the largest items are kept")
+
+        other = TopKSketch(width=1000, depth=4, top_k=2)
+        for n in range(0, 10):
+            other.add("d")
+        topk.merge(other)
+
+        self.assertEqual(topk.top(), [("d", 12), ("a", 5)],
+                         "merging re-ranks the candidates")
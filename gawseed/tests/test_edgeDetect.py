@@ -0,0 +1,368 @@
+#!/usr/bin/python3
+
+import unittest
+
+class Collector(object):
+    "An output sink that collects appended rows."
+    def __init__(self):
+        self.rows = []
+
+    def append(self, row):
+        self.rows.append(row)
+
+class NamedRows(list):
+    "Rows with column names, like an input fsdb object."
+    column_names = ['key', 'timestamp', 'value']
+
+    def get_column_number(self, name):
+        return self.column_names.index(name)
+
+class edgeDetectTests(unittest.TestCase):
+
+    def _edge_detect(self, rows, detector=None, output=None, **parameters):
+        from gawseed.analysis.edgeDetect import EdgeDetect
+
+        ed = detector or EdgeDetect()
+        ed.set_parameters([2], bin_size=60, time_column=0, key_column=1,
+                          zero_jump=5, scale_height=3,
+                          window_size=2, middle_size=1, **parameters)
+        output = output or Collector()
+        ed.edge_detect_loop(rows, output, ed._analyze_column_list)
+        return output.rows
+
+    def _data(self):
+        rows = []
+        for step in range(0, 20):
+            timestamp = str(step * 60)
+            # a steps up to 10 at step 10
+            rows.append([timestamp, 'a', '10' if step >= 10 else '1'])
+            # b only shows up sometimes, including twice at step 12
+            if step % 3 == 0:
+                rows.append([timestamp, 'b', str(step)])
+            if step == 12:
+                rows.append([timestamp, 'b', '2'])
+        # and time skips ahead
+        rows.append([str(25 * 60), 'a', '1'])
+        rows.append([str(26 * 60), 'a', '1'])
+        return rows
+
+    def test_edge_detect(self):
+        results = self._edge_detect(self._data())
+
+        # event times are offset back to the start of the windows
+        self.assertEqual(results[:3],
+                         [['420', 'a', '2.0', '11.0', '5.5', '9.0'],
+                          ['480', 'a', '2.0', '20.0', '10.0', '18.0'],
+                          ['540', 'a', '2.0', '20.0', '10.0', '18.0']],
+                         "step up detected")
+        self.assertIn(['660', 'b', '12.0', '0.0', '0', '-12.0'], results,
+                      "drop detected")
+
+    def test_edge_detect_vectorized(self):
+        self.assertEqual(self._edge_detect(self._data(), vectorized=True),
+                         self._edge_detect(self._data()),
+                         "vectorized results are identical")
+
+        # a new key's lhs prints as AverageWindow's initial 0
+        rows = []
+        for step in range(0, 10):
+            rows.append([str(step * 60), 'a', '1'])
+            if step == 8:
+                rows.append([str(step * 60), 'c', '50'])
+        for vectorized in [False, True]:
+            self.assertEqual(self._edge_detect(rows, vectorized=vectorized),
+                             [['300', 'c', '0', '50.0', '0', '50.0']])
+
+    def test_evictions(self):
+        from gawseed.analysis.edgeDetect import EdgeDetect
+
+        expected = self._edge_detect(self._data())
+        for vectorized in [False, True]:
+            ed = EdgeDetect()
+            results = self._edge_detect(self._data(), ed, vectorized=vectorized)
+            self.assertEqual(results, expected, "idle evictions don't change events")
+            self.assertEqual(ed.idle_evictions, 3, "b is evicted between appearances")
+            self.assertEqual(ed.capacity_evictions, 0, "no key limit")
+
+        # b is seen before c, is evicted and then steps up along with c
+        rows = []
+        for step in range(0, 14):
+            if step == 0 or step >= 10:
+                rows.append([str(step * 60), 'b', '50' if step >= 10 else '1'])
+            if step >= 1:
+                rows.append([str(step * 60), 'c', '50' if step >= 10 else '1'])
+        for vectorized in [False, True]:
+            ed = EdgeDetect()
+            results = self._edge_detect(rows, ed, vectorized=vectorized)
+            self.assertEqual(ed.idle_evictions, 1, "b is evicted")
+            self.assertEqual([row[:2] for row in results if row[0] == '480'],
+                             [['480', 'b'], ['480', 'c']],
+                             "b keeps its place after being evicted")
+
+        capped = []
+        for vectorized in [False, True]:
+            ed = EdgeDetect()
+            capped.append(self._edge_detect(self._data(), ed, vectorized=vectorized, max_keys=1))
+            self.assertEqual(ed.capacity_evictions, 13, "a and b evict each other")
+        self.assertEqual(capped[0], capped[1], "vectorized evictions match")
+
+    def test_algorithms(self):
+        from gawseed.analysis.edgeDetect import EdgeDetect
+
+        def edge_detect(algorithm, vectorized=False):
+            ed = EdgeDetect("edgeDetect:\n  analyzeColumns:\n" +
+                            "    - name: int(2)\n      algorithm: %s\n" % algorithm)
+            ed.set_parameters(None, bin_size=60, time_column=0, key_column=1,
+                              zero_jump=5, scale_height=3, window_size=2,
+                              middle_size=1, vectorized=vectorized)
+            output = Collector()
+            ed.edge_detect_loop(self._data(), output, None)
+            return output.rows
+
+        self.assertEqual(edge_detect('window'), self._edge_detect(self._data()))
+        for algorithm in ['ewma', 'cusum']:
+            results = edge_detect(algorithm)
+            self.assertNotEqual(results, self._edge_detect(self._data()))
+            self.assertIn(['420', 'a'], [row[:2] for row in results], "step up detected")
+            self.assertIn('b', [row[1] for row in results], "b detected")
+
+            with self.assertRaises(ValueError):
+                edge_detect(algorithm, vectorized=True)
+
+        with self.assertRaises(ValueError):
+            edge_detect('unknown')
+
+        from gawseed.analysis.edgeDetect import ALGORITHMS
+        self.assertEqual(ALGORITHMS['cusum'](2, 1, { 'drift': '0.5' })._drift, 0.5,
+                         "cusum takes its drift from the column")
+
+    def test_decaying_evictions(self):
+        from gawseed.analysis.edgeDetect import EdgeDetect
+
+        class NoEvictions(EdgeDetect):
+            def evict_idle(self):
+                pass
+
+            def dirty_keys(self):
+                return sorted(self._recent, key=self._key_order.__getitem__)
+
+        # a spikes, goes idle for a long time and then comes back
+        rows = []
+        for step in range(0, 40):
+            if step < 4 or step >= 30:
+                rows.append([str(step * 60), 'a', '50'])
+            rows.append([str(step * 60), 'z', '1'])
+
+        for algorithm in ['ewma', 'cusum']:
+            results = []
+            for detector in [EdgeDetect, NoEvictions]:
+                ed = detector("edgeDetect:\n  analyzeColumns:\n" +
+                              "    - name: int(2)\n      algorithm: %s\n" % algorithm)
+                ed.set_parameters(None, bin_size=60, time_column=0, key_column=1,
+                                  zero_jump=5, scale_height=3, window_size=2,
+                                  middle_size=1)
+                output = Collector()
+                ed.edge_detect_loop(rows, output, None)
+                results.append(output.rows)
+            self.assertIn(['780', 'a'], [row[:2] for row in results[0]],
+                          "a still decays while idle")
+            self.assertEqual(results[0], results[1], "idle keys aren't evicted")
+            self.assertEqual(ed.idle_evictions, 0)
+
+    def test_dirty_keys(self):
+        from gawseed.analysis.edgeDetect import EdgeDetect
+
+        class AllKeys(EdgeDetect):
+            def dirty_keys(self):
+                super().dirty_keys()
+                return sorted(self._recent, key=self._key_order.__getitem__)
+
+        for vectorized in [False, True]:
+            self.assertEqual(self._edge_detect(self._data(), vectorized=vectorized),
+                             self._edge_detect(self._data(), AllKeys(), vectorized=vectorized),
+                             "analyzing only dirty keys finds the same events")
+
+        # c only has data at step 0, which sits in the middle window
+        # at step 3 and reaches the lhs window at step 4
+        rows = []
+        for step in range(0, 5):
+            rows.append([str(step * 60), 'c', '5' if step == 0 else '0'])
+            rows.append([str(step * 60), 'd', '5'])
+        for vectorized in [False, True]:
+            ed = EdgeDetect()
+            self._edge_detect(rows[:8], ed, vectorized=vectorized)
+            self.assertEqual(ed.dirty_keys(), ['d'], "c is clean at step 3")
+            self._edge_detect(rows, ed, vectorized=vectorized)
+            self.assertEqual(ed.dirty_keys(), ['c', 'd'], "c is dirty at step 4")
+
+    def test_process(self):
+        from gawseed.analysis.edgeDetect import EdgeDetect
+
+        for vectorized in [False, True]:
+            expected = self._edge_detect(self._data(), vectorized=vectorized)
+
+            consumed = []
+            def rows():
+                for row in self._data():
+                    consumed.append(row)
+                    yield row
+
+            ed = EdgeDetect()
+            self._edge_detect([], ed, vectorized=vectorized)
+            events = ed.process(rows())
+            self.assertEqual(next(events), expected[0], "first event yielded")
+            # the step up at step 10 is found once step 11 starts
+            self.assertEqual(consumed[-1][0], str(11 * 60), "events are yielded early")
+            self.assertEqual([expected[0]] + list(events), expected, "all events yielded")
+
+        self.assertEqual(ed.column_names(), ['timestamp', 'key', '2_lhs', '2_rhs',
+                                             '2_scale', '2_delta'])
+
+    def test_checkpoints(self):
+        import os
+        import tempfile
+        from gawseed.analysis.edgeDetect import EdgeDetect
+
+        data = self._data()
+        for vectorized in [False, True]:
+            expected = self._edge_detect(data, vectorized=vectorized)
+            with tempfile.TemporaryDirectory() as directory:
+                checkpoint_file = os.path.join(directory, "checkpoint")
+
+                # crash at several points in the middle of the data
+                for (crash, interval) in [(20, 2), (25, 2), (25, 5), (30, 2)]:
+                    def crashing_rows():
+                        for row in data[:crash]:
+                            yield row
+                        raise KeyboardInterrupt()
+
+                    output = Collector()
+                    with self.assertRaises(KeyboardInterrupt):
+                        self._edge_detect(crashing_rows(), EdgeDetect(), output,
+                                          vectorized=vectorized,
+                                          checkpoint_file=checkpoint_file,
+                                          checkpoint_interval=interval)
+                    self.assertTrue(os.path.exists(checkpoint_file), "checkpoint saved")
+
+                    # only the events from before the checkpoint were
+                    # written, and restarting from it writes the rest
+                    self._edge_detect(data, EdgeDetect(), output, vectorized=vectorized,
+                                      checkpoint_file=checkpoint_file)
+                    self.assertEqual(output.rows, expected,
+                                     "no events lost or duplicated after crashing at row %d" % (crash))
+                    os.remove(checkpoint_file)
+
+                # a finished run can be continued with later data too
+                split = [row[0] for row in data].index(str(12 * 60))
+                events = self._edge_detect(data[:split], EdgeDetect(), vectorized=vectorized,
+                                           checkpoint_file=checkpoint_file)
+                events += self._edge_detect(data[split:], EdgeDetect(), vectorized=vectorized,
+                                            checkpoint_file=checkpoint_file)
+                self.assertEqual(events, expected, "continued from the last checkpoint")
+
+                ed = EdgeDetect()
+                ed.set_parameters([2], bin_size=60, time_column=0, key_column=1,
+                                  zero_jump=5, scale_height=3, window_size=3,
+                                  middle_size=1, vectorized=vectorized,
+                                  checkpoint_file=checkpoint_file)
+                with self.assertRaises(ValueError):
+                    list(ed.process(data))
+
+    def test_reducer_workers(self):
+        from gawseed.analysis.edgeDetect import EdgeDetect
+
+        # map output: a series of (column-key, timestamp, value) rows per key
+        rows = NamedRows()
+        for key in ['count-a', 'count-b', 'count-c']:
+            for step in range(0, 20):
+                if key != 'count-c' or step % 7 == 0:
+                    rows.append([key, str(step * 60), '10' if step >= 10 else '1'])
+
+        results = []
+        for workers in [None, 2]:
+            ed = EdgeDetect()
+            output = Collector()
+            ed.reducer_edge_detect(rows, output, timestamp_column='int(0)',
+                                   key_column='int(1)', zero_jump=5, scale_height=3,
+                                   window_size=2, middle_size=1, workers=workers)
+            results.append((output.rows, ed.idle_evictions))
+
+        self.assertEqual(results[0][0][0], ['420', 'count-a', '2.0', '11.0', '5.5', '9.0'])
+        keys = [row[1] for row in results[0][0]]
+        self.assertEqual(keys, sorted(keys), "groups are output in order")
+        self.assertEqual(results[0][1], 2, "count-c is evicted between appearances")
+        self.assertEqual(results[1], results[0], "workers produce the same events")
+
+    def test_reducer_batch(self):
+        from gawseed.analysis.edgeDetect import EdgeDetect
+
+        rows = NamedRows()
+        for step in range(0, 40):
+            if step % 3 != 1:
+                rows.append(['count-a', str(step * 60), str(0.1 * step if step < 20 else 7.3)])
+        for step in range(0, 40):
+            if step < 8 or step > 30:
+                rows.append(['count-b', str(step * 60), str(10 * (step % 4))])
+        # and a group sharing a timestep, which is handed to process()
+        rows.extend([['count-c', '0', '1'], ['count-c', '60', '1'],
+                     ['count-c', '60', '20'], ['count-c', '120', '1']])
+
+        results = []
+        for batch in [False, True]:
+            ed = EdgeDetect()
+            output = Collector()
+            ed.reducer_edge_detect(rows, output, timestamp_column='int(0)',
+                                   key_column='int(1)', zero_jump=5, scale_height=3,
+                                   window_size=2, middle_size=1, batch=batch)
+            results.append((output.rows, ed.idle_evictions))
+
+        self.assertEqual(set([row[1] for row in results[0][0]]), set(['count-a', 'count-b']))
+        # after both all zero first rows, and during count-b's gap
+        self.assertEqual(results[0][1], 3, "keys are evicted")
+        self.assertEqual(results[1], results[0], "batch detection finds identical events")
+
+    def test_reducer_scales(self):
+        from gawseed.analysis.edgeDetect import EdgeDetect
+
+        rows = NamedRows()
+        for key in ['count-a', 'count-b']:
+            for step in range(0, 60):
+                # a slow ramp up, and a spike
+                value = min(step, 30) + (50 if key == 'count-b' and step == 40 else 0)
+                rows.append([key, str(step * 60), str(value)])
+
+        def edge_detect(**parameters):
+            output = Collector()
+            EdgeDetect().reducer_edge_detect(rows, output, timestamp_column='int(0)',
+                                             key_column='int(1)', zero_jump=20,
+                                             scale_height=3, **parameters)
+            return output
+
+        output = edge_detect(windows=[{'windowSize': 1, 'middleSize': 1},
+                                      {'windowSize': 5, 'middleSize': 5}])
+        self.assertEqual(output.out_column_names[-1], 'windows')
+        self.assertEqual(set([(row[1], row[-1]) for row in output.rows]),
+                         set([('count-a', '5/5'), ('count-b', '1/1'), ('count-b', '5/5')]),
+                         "the ramp is found by the wide windows, the spike by both")
+
+        for (window_size, middle_size) in [(1, 1), (5, 5)]:
+            scale = "%d/%d" % (window_size, middle_size)
+            self.assertEqual([row[:-1] for row in output.rows if row[-1] == scale],
+                             edge_detect(window_size=window_size, middle_size=middle_size).rows,
+                             "the same events as a separate run")
+
+        # evictions are only counted once, for the first scale
+        rows = NamedRows([['count-c', str(step * 60), '1'] for step in [0, 1, 30, 31]])
+        evictions = []
+        for parameters in [{'window_size': 1, 'middle_size': 1},
+                           {'windows': [[1, 1], [5, 5]]}]:
+            ed = EdgeDetect()
+            ed.reducer_edge_detect(rows, Collector(), timestamp_column='int(0)',
+                                   key_column='int(1)', zero_jump=20, scale_height=3,
+                                   **parameters)
+            evictions.append(ed.idle_evictions)
+        self.assertEqual(evictions, [1, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
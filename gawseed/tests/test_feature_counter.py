@@ -89,6 +89,20 @@ class featureCounterTests(unittest.TestCase):
 
         self.assertEqual(expected_output, results, 'FeatureCounter.process returns correct data')
 
+    def test_compile_plan(self):
+        import gawseed.analysis.featureCounter
+        from gawseed.algorithm.generic import identity, column_value, combine_summer
+
+        fc = gawseed.analysis.featureCounter.FeatureCounter(0, { 'output':
+                                                                 { 'function': identity,
+                                                                   'arguments': [1],
+                                                                   'value': column_value,
+                                                                   'value_arguments': [2]} } )
+
+        plan = fc.compile_plan()
+        self.assertEqual(plan, [('output', identity, [1], column_value, [2], combine_summer, None)],
+                         'FeatureCounter.compile_plan flattens the output specification')
+
     def test_domain_counter(self):
         import gawseed.analysis.featureCounter
         from gawseed.algorithm.dns import PSL_domain
@@ -299,6 +313,218 @@ class featureCounterTests(unittest.TestCase):
 
         self.assertEqual(expected_output, results, 'FeatureCounter.process(PSL_registration) returns correct data')
 
+    def test_domain_counters_share_psl_split(self):
+        import gawseed.analysis.featureCounter
+        import gawseed.algorithm.dns
+        from gawseed.algorithm.dns import PSL_prefix, PSL_registration, PSL_domain
+
+        input_data = [
+            [10.5, 'www.example.com', 40],
+            [13,   'www.example.co.uk', 4200],
+            [59,   'www.example.com', 2],
+            [62,   'www.example.com', 100],
+        ]
+
+        gawseed.algorithm.dns.set_psl_cache_size(10)
+
+        fc = gawseed.analysis.featureCounter.FeatureCounter(0,
+                                                            {'pslpre':
+                                                             { 'function': PSL_prefix, 'arguments': [1] },
+                                                             'pslreg':
+                                                             { 'function': PSL_registration, 'arguments': [1] },
+                                                             'psldom':
+                                                             { 'function': PSL_domain, 'arguments': [1] } })
+
+        results = list(fc.process(input_stream = input_data))
+        self.assertEqual(len(results), 9, 'FeatureCounter.process returns all the PSL counts')
+
+        # two distinct names should only have been split twice
+        cache_info = gawseed.algorithm.dns._cached_search_tree.cache_info()
+        self.assertEqual(cache_info.misses, 2, 'each distinct name is split once')
+        self.assertEqual(cache_info.hits, 1, 'repeated names come from the cache')
+
+        gawseed.algorithm.dns.set_psl_cache_size(gawseed.algorithm.dns.PSL_CACHE_SIZE)
+
+    def test_parallel_workers(self):
+        import gawseed.analysis.featureCounter
+        from gawseed.algorithm.generic import identity, column_value
+        from gawseed.algorithm.dns import PSL_prefix
+
+        input_data = [
+            [10.5, 'www.example.com', 40],
+            [13,   'www.example.co.uk', 4200],
+            [59,   'img.google.com', 2],
+            [62,   'www.example.com', 100],
+            [62,   'www.example.tr', 200],
+            [5,    'www.example.com', 7],
+            [115,  'foo.bar.baz.com',  50],
+            [181,  'www.example.com', 1]
+        ]
+
+        def make_counter():
+            return gawseed.analysis.featureCounter.FeatureCounter(0,
+                                                                  {'pslpre':
+                                                                   { 'function': PSL_prefix, 'arguments': [1] },
+                                                                   'names':
+                                                                   { 'function': identity, 'arguments': [1],
+                                                                     'value': column_value, 'value_arguments': [2] } })
+
+        for incremental in [False, True]:
+            expected_output = list(make_counter().process(input_stream = input_data,
+                                                          incremental = incremental))
+            for chunk_size in [1, 2, 3, 100]:
+                results = list(make_counter().process(input_stream = input_data,
+                                                      incremental = incremental,
+                                                      workers = 2, chunk_size = chunk_size))
+                self.assertEqual(expected_output, results,
+                                 'FeatureCounter.process(workers=2) matches the single process output')
+
+    def test_max_lateness(self):
+        from gawseed.analysis.featureCounter import FeatureCounter
+
+        input_data = [
+            [10,  'valueA', 40],
+            [62,  'valueA', 100],
+            [13,  'valueB', 4200], # late, but within the allowed lateness
+            [125, 'valueA', 50],
+            [70,  'valueC', 200],  # late, but within the allowed lateness
+            [5,   'valueA', 2],    # too late
+            [181, 'valueA', 1]
+        ]
+
+        expected_output = [
+            [0,   'output', 'valueA', '', 1],
+            [0,   'output', 'valueB', '', 1],
+            [60,  'output', 'valueA', '', 1],
+            [60,  'output', 'valueC', '', 1],
+            [120, 'output', 'valueA', '', 1],
+            [180, 'output', 'valueA', '', 1]
+        ]
+
+        yaml_stream = """
+---
+
+timeColumn: 0
+featureCounter:
+  maxLateness: 1
+  outputs:
+    output:
+      function: identity
+      arguments: 
+        - 1
+"""
+        for workers in [None, 2]:
+            fc = FeatureCounter(yaml_specification = yaml_stream, time_column = 0)
+
+            results = []
+            for out_row in fc.process(input_stream = input_data, incremental=True,
+                                      workers = workers, chunk_size = 2):
+                results.append(out_row)
+
+            self.assertEqual(expected_output, results,
+                             'FeatureCounter.process(maxLateness=1) emits each timebin once')
+            self.assertEqual(fc.late_rows, 1, 'one row was too late to be counted')
+
+    def test_spill_to_disk(self):
+        import gawseed.analysis.featureCounter
+        from gawseed.algorithm.generic import identity, column_value
+        from gawseed.algorithm.dns import PSL_prefix
+
+        input_data = [
+            [10.5, 'www.example.com', 40],
+            [13,   'www.example.co.uk', 4200],
+            [59,   'img.google.com', 2],
+            [20,   'mail.example.com', 8],
+            [21,   'www.example.com', 3],
+            [62,   'www.example.com', 100],
+            [62,   'www.example.tr', 200],
+            [5,    'img.google.com', 7],
+            [115,  'foo.bar.baz.com',  50],
+            [116,  'www.example.tr',  50],
+            [181,  'www.example.com', 1]
+        ]
+
+        def make_counter(max_entries):
+            return gawseed.analysis.featureCounter.FeatureCounter(0,
+                                                                  {'pslpre':
+                                                                   { 'function': PSL_prefix, 'arguments': [1] },
+                                                                   'names':
+                                                                   { 'function': identity, 'arguments': [1],
+                                                                     'value': column_value, 'value_arguments': [2] } },
+                                                                  max_entries = max_entries)
+
+        for incremental in [False, True]:
+            expected_output = list(make_counter(None).process(input_stream = input_data,
+                                                              incremental = incremental))
+            for max_entries in [1, 2, 3, 5]:
+                fc = make_counter(max_entries)
+                results = list(fc.process(input_stream = input_data,
+                                          incremental = incremental))
+                self.assertEqual(expected_output, results,
+                                 'FeatureCounter.process(max_entries=%d) matches the in-memory output' % (max_entries))
+                self.assertTrue(fc.spills > 0, 'data was spilled to disk')
+
+    def test_sketch_counter(self):
+        from gawseed.analysis.featureCounter import FeatureCounter
+
+        input_data = [
+            [0,  'valueA', 42],
+            [0,  'valueB', 4200],
+            [0,  'valueA', 52],
+            [0,  'valueC', 10],
+            [0,  'valueA', 150],
+            [0,  'valueC', 200],
+            [60, 'valueD', 1]
+        ]
+
+        yaml_stream = """
+---
+
+timeColumn: 0
+featureCounter:
+  outputs:
+    output:
+      function: identity
+      arguments: [1]
+      sketch:
+        width: 1000
+        depth: 3
+        topK: 2
+"""
+        fc = FeatureCounter(yaml_specification = yaml_stream, time_column = 0)
+        results = list(fc.process(input_stream = input_data))
+
+        error_bound = 2.718281828459045 / 1000
+        expected_output = [
+            [0,  'output', 'valueA', '', 3],
+            [0,  'output', 'valueC', '', 2],
+            [0,  'output_error', 'valueA', '', error_bound * 6],
+            [0,  'output_error', 'valueC', '', error_bound * 6],
+            [60, 'output', 'valueD', '', 1],
+            [60, 'output_error', 'valueD', '', error_bound],
+        ]
+
+        self.assertEqual(len(expected_output), len(results), 'only the top keys are reported')
+        for (expected, result) in zip(expected_output, results):
+            self.assertEqual(expected[:4], result[:4])
+            self.assertAlmostEqual(expected[4], result[4])
+
+        # the sketch survives spilling and parallel counting of the other outputs
+        def make_counter(max_entries = None):
+            return FeatureCounter(0, { 'sketched': { 'function': 'identity', 'arguments': [1],
+                                                     'sketch': { 'width': 1000, 'topK': 2 } },
+                                       'output': { 'function': 'identity', 'arguments': [1] } },
+                                  max_entries = max_entries)
+
+        expected_output = list(make_counter().process(input_stream = input_data))
+        self.assertEqual(expected_output,
+                         list(make_counter(1).process(input_stream = input_data)),
+                         'spilling leaves sketch outputs alone')
+        self.assertEqual(expected_output,
+                         list(make_counter().process(input_stream = input_data,
+                                                     workers = 2, chunk_size = 3)),
+                         'sketches from multiple workers are merged')
+
     def test_different_column_value_extractor_spec(self):
         from gawseed.analysis.featureCounter import FeatureCounter
 
@@ -0,0 +1,32 @@
+import unittest
+
+class hyperLogLogTests(unittest.TestCase):
+    def test_cardinality(self):
+        from gawseed.hyperLogLog import HyperLogLog
+        hll = HyperLogLog(precision=12)
+
+        for n in range(0, 20000):
+            hll.add("name%d" % (n % 10000))
+
+        self.assertAlmostEqual(hll.cardinality(), 10000, delta=500,
+                               msg="estimate is close to the unique count")
+
+    def test_serialize_and_merge(self):
+        from gawseed.hyperLogLog import HyperLogLog
+        left = HyperLogLog(precision=10)
+        right = HyperLogLog(precision=10)
+
+        for n in range(0, 50):
+            left.add(n)
+        for n in range(25, 100):
+            right.add(n)
+
+        serialized = right.serialize()
+        self.assertTrue(HyperLogLog.is_serialized(serialized))
+
+        left.merge(HyperLogLog.deserialize(serialized))
+        self.assertAlmostEqual(left.cardinality(), 100, delta=5,
+                               msg="merged estimate covers both sets")
+
+        with self.assertRaises(ValueError):
+            left.merge(HyperLogLog(precision=12))
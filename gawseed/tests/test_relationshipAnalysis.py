@@ -290,6 +290,120 @@ class relationshipAnalysisTests(unittest.TestCase):
 
         self.assertEqual(results, expected_results, "expected results from loading by function name")
 
+    def test_vectorized(self):
+        import gawseed.algorithm.relationship
+
+        def label(bundle, key, subkey, current_slot, args):
+            if 'data1' in current_slot:
+                return key + "/" + subkey
+
+        output_columns = {
+            'frac': { 'function': 'fraction', 'arguments': [ 'data1', 'data2' ] },
+            'val': { 'function': 'value', 'arguments': [ 'data2' ] },
+            'one': { 'function': 'one' },
+            'keyfrac': { 'function': 'fraction_otherindex_keyval', 'arguments': [ 'data1', 'total' ] },
+            'label': { 'function': label },
+        }
+
+        input_data = [
+            ['60',  'data1', 'k1', 's1', 10.0],
+            ['60',  'data1', 'k2', 's2', 10.0],
+            ['60',  'data2', 'k1', 's1', 10.0],
+            ['60',  'data2', 'k2', 's2', 20.0],
+            ['60',  'total', 'k1', '', 40.0],
+            ['60',  'total', 'k2', '', 0.0],
+
+            ['120', 'data1', 'k1', 's1', 10.0],
+            ['120', 'data2', 'k2', 's2', 10.0],
+            ['120', 'total', 'k1', '', 20.0],
+        ]
+
+        expected_results = [
+            ['60',  'k1', 's1', 1.0, 10.0, 1.0, 0.25, 'k1/s1'],
+            ['60',  'k1', '', None, None, 1.0, None, None],
+            ['60',  'k2', 's2', 0.5, 20.0, 1.0, None, 'k2/s2'],
+            ['60',  'k2', '', None, None, 1.0, None, None],
+            ['120', 'k1', 's1', None, None, 1.0, 0.5, 'k1/s1'],
+            ['120', 'k1', '', None, None, 1.0, None, None],
+            ['120', 'k2', 's2', None, 10.0, 1.0, None, None],
+        ]
+
+        ra = RelationshipAnalysis(output_columns = dict(output_columns))
+        self.assertEqual(list(ra.process(input_data)), expected_results,
+                         "per-cell results")
+
+        ra = RelationshipAnalysis(output_columns = dict(output_columns),
+                                  vectorized = True)
+        self.assertEqual(list(ra.process(input_data)), expected_results,
+                         "vectorized results match the per-cell results")
+
+        yaml_specification = """
+relationshipAnalysis:
+  vectorized: true
+  outputs:
+    frac:
+      function: fraction
+      arguments: [ 'data1', 'data2' ]
+"""
+        ra = RelationshipAnalysis(yaml_specification = yaml_specification)
+        self.assertEqual(list(ra.process(input_data)),
+                         [row[:4] for row in expected_results if row[3] is not None],
+                         "vectorized results from YAML")
+
+    def test_registration_denominator(self):
+        import gawseed.algorithm.dns
+        from gawseed.algorithm.relationship import bundle_cache
+
+        ra = RelationshipAnalysis(
+                                  output_columns =
+                                  { 'regfrac': { 'function': gawseed.algorithm.dns.dnsRegistrationFraction,
+                                                 'arguments': [ 'domains', 'registrations' ] } }
+                                  )
+
+        input_data = [
+            ['60',  'domains', 'example.com', '', 10.0],
+            ['60',  'domains', 'example2.com', '', 30.0],
+            ['60',  'registrations', 'com', '', 40.0],
+
+            # the registration count changes in the next timebin
+            ['120', 'domains', 'example.com', '', 10.0],
+            ['120', 'registrations', 'com', '', 20.0],
+        ]
+
+        self.assertEqual(list(ra.process(input_data)),
+                         [['60', 'example.com', '', 0.25],
+                          ['60', 'example2.com', '', 0.75],
+                          ['120', 'example.com', '', 0.5]],
+                         "registration counts are not reused across timebins")
+
+        bundle = { 'time_index': '60', 'data': {} }
+        bundle_cache(bundle, 'test')['x'] = 1
+        self.assertEqual(bundle_cache(bundle, 'test'), { 'x': 1 },
+                         "functions share a bundle's cache")
+
+    def test_parallel_workers(self):
+        input_data = []
+        for timestamp in range(0, 600, 60):
+            input_data.append([str(timestamp), 'data1', 'k1', 's1', float(timestamp + 10)])
+            input_data.append([str(timestamp), 'data2', 'k1', 's1', 10.0])
+            input_data.append([str(timestamp), 'data1', 'k2', 's2', 5.0])
+
+        output_columns = { 'col1': { 'function': 'fraction',
+                                     'arguments': [ 'data1', 'data2' ] } }
+
+        ra = RelationshipAnalysis(output_columns = output_columns)
+        expected_results = list(ra.process(input_data))
+
+        ra = RelationshipAnalysis(output_columns = output_columns)
+        self.assertEqual(list(ra.process(input_data, workers = 3)), expected_results,
+                         "workers produce the same rows in the same order")
+
+        ra = RelationshipAnalysis(output_columns =
+                                  { 'col1': { 'function': 'value_max',
+                                              'arguments': [ 'data1' ] } })
+        with self.assertRaises(ValueError):
+            list(ra.process(input_data, workers = 2))
+
 
 if __name__ == '__main__':
     unittest.main()